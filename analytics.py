@@ -0,0 +1,238 @@
+# analytics.py
+"""Columnar export of order and trade history, and vectorized analytics on it.
+
+Tables are streamed out of SQLite in chunks of NumPy arrays through a
+read-only connection of their own. In WAL mode that never blocks the
+matching engine's writer. Chunks can be written to disk as .npz files,
+or as Parquet files when pyarrow is installed. Analysis then runs on
+those files instead of the live database:
+
+    python analytics.py order_book.db exports/
+    orders = analytics.load('exports/', 'orders')
+    trades = analytics.load('exports/', 'trades')
+    analytics.fill_ratios(orders)
+
+numpy (and pyarrow for Parquet) are only needed by this module and are
+imported on first use.
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+
+# Columns exported per table, with their NumPy dtypes ('str' lets NumPy
+# pick a fixed-width unicode dtype for the chunk)
+COLUMNS = {
+    'orders': (('order_id', 'int64'), ('timestamp', 'datetime64[us]'), ('type', 'str'),
+               ('symbol', 'str'), ('price', 'float64'), ('quantity', 'float64'),
+               ('status', 'str'), ('filled_qty', 'float64'), ('order_kind', 'str'),
+               ('entered_at', 'datetime64[us]'), ('updated_at', 'datetime64[us]')),
+    'trades': (('trade_id', 'int64'), ('timestamp', 'datetime64[us]'), ('buy_order_id', 'int64'),
+               ('sell_order_id', 'int64'), ('symbol', 'str'), ('price', 'float64'),
+               ('quantity', 'float64')),
+}
+KEYS = {'orders': 'order_id', 'trades': 'trade_id'}
+FORMATS = ('npz', 'parquet')
+
+def _numpy():
+    # Imported here so the rest of the app runs without numpy installed
+    import numpy
+    return numpy
+
+def _connect_readonly(db_file):
+    return sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
+
+def iter_table(db_file, table, chunk_size=100000):
+    """Yield {column: array} chunks of up to chunk_size rows in key order.
+
+    An empty table yields one empty chunk, so its columns and dtypes are
+    still exported.
+    """
+    np = _numpy()
+    columns = COLUMNS[table]
+    conn = _connect_readonly(db_file)
+    try:
+        cursor = conn.execute(f"SELECT {', '.join(name for name, _ in columns)} FROM {table} "
+                              f"ORDER BY {KEYS[table]}")
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            yield {name: np.array((), dtype=dtype) for name, dtype in columns}
+            return
+        while rows:
+            values = list(zip(*rows))
+            yield {name: np.array(column, dtype=None if dtype == 'str' else dtype)
+                   for (name, dtype), column in zip(columns, values)}
+            rows = cursor.fetchmany(chunk_size)
+    finally:
+        conn.close()
+
+def export(db_file, directory, tables=('orders', 'trades'), chunk_size=100000, format='npz'):
+    """Write each table as numbered chunk files in directory; return the paths written."""
+    if format not in FORMATS:
+        raise ValueError(f"Unknown export format: {format}")
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for table in tables:
+        for stale in glob.glob(os.path.join(directory, f"{table}-*.*")):
+            os.remove(stale)
+        for i, chunk in enumerate(iter_table(db_file, table, chunk_size)):
+            path = os.path.join(directory, f"{table}-{i:05d}.{format}")
+            if format == 'npz':
+                _numpy().savez(path, **chunk)
+            else:
+                _write_parquet(path, chunk)
+            paths.append(path)
+    return paths
+
+def _write_parquet(path, chunk):
+    import pyarrow
+    import pyarrow.parquet
+    pyarrow.parquet.write_table(pyarrow.table(chunk), path)
+
+def load(directory, table):
+    """Concatenate a table's exported chunks into one {column: array} dict."""
+    np = _numpy()
+    paths = sorted(glob.glob(os.path.join(directory, f"{table}-*.npz")))
+    if paths:
+        chunks = []
+        for path in paths:
+            with np.load(path) as data:
+                chunks.append({name: data[name] for name in data.files})
+    else:
+        paths = sorted(glob.glob(os.path.join(directory, f"{table}-*.parquet")))
+        if not paths:
+            raise FileNotFoundError(f"No exported {table} chunks in {directory}")
+        import pyarrow.parquet
+        chunks = [{name: column.to_numpy() for name, column in
+                   zip(t.column_names, t.columns)} for t in map(pyarrow.parquet.read_table, paths)]
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+def fill_ratios(orders):
+    """Return (symbols, filled quantity / ordered quantity) over all orders per symbol."""
+    np = _numpy()
+    symbols, index = np.unique(orders['symbol'], return_inverse=True)
+    filled = np.bincount(index, weights=orders['filled_qty'], minlength=len(symbols))
+    ordered = np.bincount(index, weights=orders['quantity'], minlength=len(symbols))
+    return symbols, np.divide(filled, ordered, out=np.zeros_like(filled), where=ordered > 0)
+
+def order_end_times(orders, trades):
+    """Return the time each order stopped resting, as far as the history shows.
+
+    Filled orders end at their last trade. Open and partially filled
+    orders have not ended (NaT). Cancelled orders end when they were
+    cancelled; where the cancel time is unknown (updated_at is NaT or
+    missing), at their last trade, or at entry if they never traded.
+    """
+    np = _numpy()
+    order_ids = orders['order_id']
+    ends = entry_times(orders).copy()
+    if not len(order_ids):
+        return ends
+    for side in ('buy_order_id', 'sell_order_id'):
+        index = np.searchsorted(order_ids, trades[side])
+        index = np.clip(index, 0, len(order_ids) - 1)
+        known = order_ids[index] == trades[side]
+        np.maximum.at(ends, index[known], trades['timestamp'][known])
+    if 'updated_at' in orders:
+        cancelled = (orders['status'] == 'cancelled') & ~np.isnat(orders['updated_at'])
+        ends[cancelled] = orders['updated_at'][cancelled]
+    ends[np.isin(orders['status'], ('open', 'partial'))] = np.datetime64('NaT')
+    return ends
+
+def entry_times(orders):
+    """Return the time each order was entered.
+
+    An amend that changes the price resets an order's timestamp (its time
+    priority), so entered_at is used where it is known.
+    """
+    np = _numpy()
+    if 'entered_at' not in orders:
+        return orders['timestamp']
+    return np.where(np.isnat(orders['entered_at']), orders['timestamp'], orders['entered_at'])
+
+def spread_over_time(orders, trades, symbol, times):
+    """Return (best bids, best asks, spreads) for symbol at each of the given times.
+
+    The book at time t is rebuilt from limit orders entered at or before t
+    that had not ended by then (see entry_times and order_end_times). An
+    amended order is counted at its latest price from entry on, since
+    earlier prices are not stored. A side with no
+    orders gives NaN. Each order is live over a contiguous run of the
+    sorted sample times, so both sides are answered with one _range_max
+    pass: O(orders + samples log samples).
+    """
+    np = _numpy()
+    times = np.asarray(times, dtype='datetime64[us]')
+    mask = orders['symbol'] == symbol
+    if 'order_kind' in orders:
+        # Market, IOC and FOK orders never rest on the book
+        mask &= orders['order_kind'] == 'limit'
+    ends = order_end_times(orders, trades)[mask]
+    order = np.argsort(times, kind='stable')
+    sorted_times = times[order]
+    # Sample indexes [first, stop) at which each order is on the book
+    first = np.searchsorted(sorted_times, entry_times(orders)[mask], side='left')
+    stop = np.searchsorted(sorted_times, ends, side='left')
+    stop[np.isnat(ends)] = len(times)
+    prices = orders['price'][mask]
+    is_buy = orders['type'][mask] == 'buy'
+    bids = np.empty(len(times))
+    asks = np.empty(len(times))
+    bids[order] = _range_max(first[is_buy], stop[is_buy], prices[is_buy], len(times))
+    asks[order] = -_range_max(first[~is_buy], stop[~is_buy], -prices[~is_buy], len(times))
+    bids[np.isinf(bids)] = np.nan
+    asks[np.isinf(asks)] = np.nan
+    return bids, asks, asks - bids
+
+def _range_max(first, stop, values, n):
+    """Return, for each of n points, the largest value whose [first, stop) range covers it.
+
+    Points no range covers get -inf. Like a sparse table in reverse, each
+    range is written to the two power-of-two blocks that exactly cover
+    it, and the blocks are then pushed down level by level to the points.
+    """
+    np = _numpy()
+    keep = stop > first
+    first, stop, values = first[keep], stop[keep], values[keep]
+    if not n or not len(values):
+        return np.full(n, -np.inf)
+    # frexp gives exponents e with 2**(e-1) <= length < 2**e
+    level = np.frexp(stop - first)[1] - 1
+    table = np.full((int(level.max()) + 1, n), -np.inf)
+    np.maximum.at(table, (level, first), values)
+    np.maximum.at(table, (level, stop - (1 << level)), values)
+    for k in range(len(table) - 1, 0, -1):
+        half = 1 << (k - 1)
+        np.maximum(table[k - 1], table[k], out=table[k - 1])
+        np.maximum(table[k - 1][half:], table[k][:n - half], out=table[k - 1][half:])
+    return table[0]
+
+def depth_profile(orders, symbol, levels=10):
+    """Return ((bid prices, quantities), (ask prices, quantities)) for symbol's live orders.
+
+    Remaining quantity is summed per price over open and partially
+    filled orders, best levels first, up to `levels` per side.
+    """
+    np = _numpy()
+    live = (orders['symbol'] == symbol) & np.isin(orders['status'], ('open', 'partial'))
+    remaining = orders['quantity'] - orders['filled_qty']
+    sides = []
+    for side, best_first in (('buy', -1), ('sell', 1)):
+        mask = live & (orders['type'] == side)
+        prices, index = np.unique(orders['price'][mask], return_inverse=True)
+        quantities = np.bincount(index, weights=remaining[mask], minlength=len(prices))
+        order = np.argsort(best_first * prices, kind='stable')[:levels]
+        sides.append((prices[order], quantities[order]))
+    return tuple(sides)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export order and trade history as columnar chunks.")
+    parser.add_argument('db_file')
+    parser.add_argument('directory')
+    parser.add_argument('--tables', nargs='+', choices=sorted(COLUMNS), default=['orders', 'trades'])
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--format', choices=FORMATS, default='npz')
+    args = parser.parse_args()
+    paths = export(args.db_file, args.directory, args.tables, args.chunk_size, args.format)
+    print(f"Wrote {len(paths)} chunk files to {args.directory}")
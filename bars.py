@@ -0,0 +1,112 @@
+# bars.py
+"""Per-symbol OHLCV bars maintained incrementally from fills.
+
+Each fill updates one bar per configured interval, so the bars never
+need to be recomputed from the trades table. Only bars touched since
+the last write are held in memory. write() merges them into the bars
+table with an upsert, in the same transaction as the trades that
+produced them. The table therefore stays consistent with the trades
+across restarts, even when a bucket spans one.
+
+Bucket starts are UTC ISO timestamps like the trades table, aligned to
+multiples of the interval since the Unix epoch.
+"""
+
+from datetime import datetime, timedelta
+
+from matching_engine import Fill, from_lots, from_ticks, to_lots, to_ticks
+
+# 1 minute, 5 minutes, 1 hour, 1 day
+DEFAULT_INTERVALS = (60, 300, 3600, 86400)
+
+EPOCH = datetime(1970, 1, 1)
+
+class BarAggregator:
+    """Accumulate fills into per-symbol, per-interval bars until written."""
+
+    def __init__(self, intervals=DEFAULT_INTERVALS):
+        if not intervals or any(interval <= 0 for interval in intervals):
+            raise ValueError(f"Invalid bar intervals: {intervals!r}")
+        self.intervals = tuple(sorted(set(int(interval) for interval in intervals)))
+        # (symbol, interval, bucket start) -> [open, high, low, close, volume, notional, trades]
+        # with prices in ticks, volume in lots and notional in ticks * lots
+        self._pending = {}
+        self._last_timestamp = None
+        self._last_seconds = 0
+
+    def _seconds(self, timestamp):
+        # Fills from one sweep share timestamps closely, so cache the last parse
+        if timestamp != self._last_timestamp:
+            self._last_timestamp = timestamp
+            self._last_seconds = int((datetime.fromisoformat(timestamp) - EPOCH).total_seconds())
+        return self._last_seconds
+
+    def add_fills(self, fills):
+        """Fold engine fills (prices in ticks, quantities in lots) into the pending bars."""
+        pending = self._pending
+        for fill in fills:
+            seconds = self._seconds(fill.timestamp)
+            price = fill.price
+            quantity = fill.quantity
+            for interval in self.intervals:
+                key = (fill.symbol, interval, seconds - seconds % interval)
+                bar = pending.get(key)
+                if bar is None:
+                    pending[key] = [price, price, price, price, quantity, price * quantity, 1]
+                    continue
+                if price > bar[1]:
+                    bar[1] = price
+                elif price < bar[2]:
+                    bar[2] = price
+                bar[3] = price
+                bar[4] += quantity
+                bar[5] += price * quantity
+                bar[6] += 1
+
+    def write(self, cursor):
+        """Merge the pending bars into the bars table and forget them.
+
+        Call inside the transaction that inserts the corresponding trades.
+        """
+        if not self._pending:
+            return
+        cursor.executemany("""
+            INSERT INTO bars (symbol, interval, start, open, high, low, close, volume, notional, trade_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (symbol, interval, start) DO UPDATE SET
+                high = MAX(high, excluded.high),
+                low = MIN(low, excluded.low),
+                close = excluded.close,
+                volume = volume + excluded.volume,
+                notional = notional + excluded.notional,
+                trade_count = trade_count + excluded.trade_count
+        """, [(symbol, interval, bucket_start(start),
+               from_ticks(bar[0]), from_ticks(bar[1]), from_ticks(bar[2]), from_ticks(bar[3]),
+               from_lots(bar[4]), from_ticks(from_lots(bar[5])), bar[6])
+              for (symbol, interval, start), bar in self._pending.items()])
+        self._pending = {}
+
+    def discard(self):
+        """Forget the pending bars, e.g. after the transaction writing them failed."""
+        self._pending = {}
+
+def bucket_start(seconds):
+    """Return the ISO timestamp of a bucket starting `seconds` after the epoch."""
+    return (EPOCH + timedelta(seconds=seconds)).isoformat()
+
+def backfill(conn, intervals=DEFAULT_INTERVALS, batch_size=100000):
+    """Rebuild the bars table from the full trades table, e.g. after an upgrade."""
+    aggregator = BarAggregator(intervals)
+    cursor = conn.cursor()
+    with conn:
+        cursor.execute("DELETE FROM bars")
+        rows = conn.execute("""
+            SELECT timestamp, symbol, price, quantity FROM trades ORDER BY timestamp ASC, trade_id ASC
+        """)
+        while True:
+            batch = rows.fetchmany(batch_size)
+            if not batch:
+                break
+            aggregator.add_fills([Fill(None, timestamp, symbol, None, None, to_ticks(price), to_lots(quantity), 0, 0)
+                                  for timestamp, symbol, price, quantity in batch])
+            aggregator.write(cursor)
@@ -0,0 +1,97 @@
+# benchmarks/bench_indexes.py
+"""Time the live-order and trade queries as the orders table grows.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_indexes --sizes 10000 100000 1000000
+
+Each size is measured twice on a scratch database, once with the plain
+tables and once after db_setup.create_indexes(). The number of live
+(open) orders is held constant so only the history grows.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from db_setup import create_tables, create_indexes, INDEXES
+
+SYMBOLS = ['AAPL', 'GOOGL', 'AMZN', 'MSFT', 'TSLA']
+
+QUERIES = {
+    'book': ("""
+        SELECT price, SUM(quantity - filled_qty) FROM orders
+        WHERE type='buy' AND status IN ('open', 'partial') AND symbol=?
+        GROUP BY price ORDER BY price DESC
+    """, ('AAPL',)),
+    'open_orders': ("""
+        SELECT order_id, timestamp, type, symbol, price, (quantity - filled_qty), status
+        FROM orders WHERE status IN ('open', 'partial') ORDER BY timestamp ASC
+    """, ()),
+    'recent_trades': ("""
+        SELECT trade_id, timestamp, symbol, price, quantity
+        FROM trades ORDER BY timestamp DESC LIMIT 100
+    """, ()),
+}
+
+def populate(conn, n_orders, n_open, seed=0):
+    """Fill the tables with n_orders orders, n_open of them still open."""
+    rng = random.Random(seed)
+    orders = []
+    trades = []
+    for i in range(n_orders):
+        timestamp = f"2025-01-01T00:00:{i:012d}"
+        status = 'open' if i >= n_orders - n_open else 'filled'
+        price = round(100 + rng.uniform(-5, 5), 2)
+        orders.append((timestamp, rng.choice(('buy', 'sell')), rng.choice(SYMBOLS),
+                       price, 100, status, 0 if status == 'open' else 100))
+        if status == 'filled' and i % 2:
+            trades.append((timestamp, i, i + 1, orders[-1][2], price, 100))
+    conn.executemany("""
+        INSERT INTO orders (timestamp, type, symbol, price, quantity, status, filled_qty)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, orders)
+    conn.executemany("""
+        INSERT INTO trades (timestamp, buy_order_id, sell_order_id, symbol, price, quantity)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, trades)
+    conn.commit()
+
+def time_query(conn, sql, params, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def run(sizes, n_open, repeat):
+    print(f"{'rows':>10} {'query':<14} {'no index (ms)':>14} {'indexed (ms)':>13}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+            create_tables(conn)
+            for index in INDEXES:
+                name = index.split('EXISTS', 1)[1].split()[0]
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+            populate(conn, size, n_open)
+            plain = {name: time_query(conn, sql, params, repeat)
+                     for name, (sql, params) in QUERIES.items()}
+            create_indexes(conn)
+            conn.execute("ANALYZE")
+            indexed = {name: time_query(conn, sql, params, repeat)
+                       for name, (sql, params) in QUERIES.items()}
+            conn.close()
+        for name in QUERIES:
+            print(f"{size:>10} {name:<14} {plain[name] * 1000:>14.3f} {indexed[name] * 1000:>13.3f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--open', type=int, default=500, help='number of live orders')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.open, args.repeat)
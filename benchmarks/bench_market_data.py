@@ -0,0 +1,43 @@
+# benchmarks/bench_market_data.py
+"""Compare serial and pooled price refreshes against a simulated provider.
+
+Run from the repository root (no network needed):
+
+    python -m benchmarks.bench_market_data --symbols 50 --latency 0.2
+"""
+
+import argparse
+import time
+
+from market_data import FakeProvider, MarketDataService
+
+def run(n_symbols, latency, workers):
+    symbols = [f"SYM{i}" for i in range(n_symbols)]
+    provider = FakeProvider(latency=latency)
+
+    start = time.perf_counter()
+    for symbol in symbols:
+        provider.fetch_price(symbol)
+    serial = time.perf_counter() - start
+
+    service = MarketDataService(provider, ttl=60.0, max_workers=workers)
+    start = time.perf_counter()
+    service.get_prices(symbols)
+    pooled = time.perf_counter() - start
+
+    start = time.perf_counter()
+    service.get_prices(symbols)
+    cached = time.perf_counter() - start
+
+    print(f"{n_symbols} symbols, {latency * 1000:.0f} ms per fetch, {workers} workers")
+    print(f"  serial refresh: {serial * 1000:10.1f} ms")
+    print(f"  pooled refresh: {pooled * 1000:10.1f} ms")
+    print(f"  cached refresh: {cached * 1000:10.3f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--workers', type=int, default=50)
+    args = parser.parse_args()
+    run(args.symbols, args.latency, args.workers)
@@ -0,0 +1,252 @@
+# benchmarks/bench_matching.py
+"""Throughput, latency and memory of the order book entry points.
+
+Run from the repository root (no network needed):
+
+    python -m benchmarks.bench_matching --orders 20000 --output results.json
+    python -m benchmarks.bench_matching --compare results.json
+
+Synthetic flow from benchmarks.order_flow is replayed on a scratch
+database through each code path:
+
+* place_order    - orders matched on entry via submit_order(), which is what
+                   place_order() runs with continuous matching on
+* cancel_order   - the cancels from that same replay
+* match_orders   - orders rested, then swept every --sweep orders
+* get_order_book - depth queries against the resulting books
+
+For each path, the run reports calls/sec, orders/sec, fills/sec, and
+p50/p99 latency per call. Peak traced memory comes from a second,
+identical pass under tracemalloc, so tracing does not skew the timings.
+With --stages, the timed pass also records order_book's metrics and
+adds the per-stage breakdown (match, persist, ...) to the results.
+Results are written as JSON with sorted keys, so files from two versions
+diff cleanly. --compare prints the change against an earlier file.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+import order_book
+from db_setup import create_tables
+from benchmarks.order_flow import DISTRIBUTIONS, generate
+
+PATHS = ('place_order', 'cancel_order', 'match_orders', 'get_order_book')
+
+@contextlib.contextmanager
+def scratch_database(durability):
+    """Point order_book at an empty database in a temporary directory."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path)
+        create_tables(conn)
+        conn.close()
+        order_book.set_database(path)
+        order_book.configure_persistence(durability=durability)
+        try:
+            yield
+        finally:
+            order_book.set_continuous_matching(False)
+            # Release the scratch file before the directory is removed
+            order_book.set_database(':memory:')
+
+class Recorder:
+    """Latencies and counts for one code path."""
+
+    def __init__(self):
+        self.latencies = []
+        self.orders = 0
+        self.fills = 0
+
+    def summary(self):
+        if not self.latencies:
+            return {'calls': 0}
+        latencies = sorted(self.latencies)
+        total = sum(latencies) / 1e9
+        return {
+            'calls': len(latencies),
+            'orders': self.orders,
+            'fills': self.fills,
+            'seconds': round(total, 6),
+            'calls_per_sec': round(len(latencies) / total, 1),
+            'orders_per_sec': round(self.orders / total, 1),
+            'fills_per_sec': round(self.fills / total, 1),
+            'p50_us': round(latencies[len(latencies) // 2] / 1000, 2),
+            'p99_us': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] / 1000, 2),
+        }
+
+def replay_entry(flow, recorders):
+    """Place every order matched on entry and send the cancels to cancel_order."""
+    place, cancel = recorders['place_order'], recorders['cancel_order']
+    order_ids = []
+    clock = time.perf_counter_ns
+    for request in flow:
+        if request[0] == 'new':
+            start = clock()
+            order_id, fills = order_book.submit_order(*request[1:])
+            place.latencies.append(clock() - start)
+            place.orders += 1
+            place.fills += len(fills)
+            order_ids.append(order_id)
+        else:
+            start = clock()
+            order_book.cancel_order(order_ids[request[1]])
+            cancel.latencies.append(clock() - start)
+            cancel.orders += 1
+
+def replay_sweeps(flow, recorder, sweep):
+    """Rest orders without matching and time a match_orders() sweep every `sweep` orders."""
+    order_book.set_continuous_matching(False)
+    order_ids = []
+    pending = 0
+    clock = time.perf_counter_ns
+
+    def run_sweep():
+        start = clock()
+        fills = order_book.match_orders()
+        recorder.latencies.append(clock() - start)
+        recorder.orders += pending
+        recorder.fills += len(fills)
+
+    for request in flow:
+        if request[0] == 'new':
+            order_ids.append(order_book.place_order(*request[1:]))
+            pending += 1
+            if pending == sweep:
+                run_sweep()
+                pending = 0
+        else:
+            order_book.cancel_order(order_ids[request[1]])
+    if pending:
+        run_sweep()
+
+def query_books(symbols, recorder, queries, depth, seed):
+    rng = random.Random(seed)
+    clock = time.perf_counter_ns
+    for _ in range(queries):
+        symbol = rng.choice(symbols)
+        start = clock()
+        order_book.get_order_book(symbol, depth)
+        recorder.latencies.append(clock() - start)
+
+def order_flow(args):
+    return generate(args.orders, args.symbols, args.seed, args.distribution, args.spread,
+                    args.cancel_ratio, args.crossing_rate)
+
+def flow_symbols(args):
+    return sorted({request[2] for request in order_flow(args) if request[0] == 'new'})
+
+def run_paths(args):
+    """Replay the flow through every path and return their Recorders."""
+    recorders = {path: Recorder() for path in PATHS}
+    symbols = flow_symbols(args)
+    with scratch_database(args.durability):
+        replay_entry(order_flow(args), recorders)
+        query_books(symbols, recorders['get_order_book'], args.queries, args.depth, args.seed)
+    with scratch_database(args.durability):
+        replay_sweeps(order_flow(args), recorders['match_orders'], args.sweep)
+    return recorders
+
+def measure_memory(args):
+    """Peak traced memory in KiB per path, from a separate traced pass."""
+    peaks = {}
+    symbols = flow_symbols(args)
+    tracemalloc.start()
+    try:
+        with scratch_database(args.durability):
+            tracemalloc.reset_peak()
+            replay_entry(order_flow(args), {path: Recorder() for path in PATHS})
+            peaks['place_order'] = peaks['cancel_order'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+            query_books(symbols, Recorder(), args.queries, args.depth, args.seed)
+            peaks['get_order_book'] = tracemalloc.get_traced_memory()[1]
+        with scratch_database(args.durability):
+            tracemalloc.reset_peak()
+            replay_sweeps(order_flow(args), Recorder(), args.sweep)
+            peaks['match_orders'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {path: round(peak / 1024, 1) for path, peak in peaks.items()}
+
+def run(args):
+    metrics = order_book.enable_metrics(args.stages)
+    metrics.reset()
+    recorders = run_paths(args)
+    order_book.enable_metrics(False)
+    results = {path: recorder.summary() for path, recorder in recorders.items()}
+    if args.memory:
+        for path, peak in measure_memory(args).items():
+            results[path]['peak_kib'] = peak
+    stages = metrics.export()['stages'] if args.stages else {}
+    return {
+        'stages': stages,
+        'parameters': {name: getattr(args, name) for name in (
+            'orders', 'symbols', 'seed', 'distribution', 'spread', 'cancel_ratio',
+            'crossing_rate', 'sweep', 'queries', 'depth', 'durability')},
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                        'machine': platform.machine()},
+        'results': results,
+    }
+
+METRICS = ('calls_per_sec', 'orders_per_sec', 'fills_per_sec', 'p50_us', 'p99_us', 'peak_kib')
+
+def report(results, baseline=None):
+    print(f"{'path':<15} " + ' '.join(f"{metric:>15}" for metric in METRICS))
+    for path in PATHS:
+        current = results['results'][path]
+        old = (baseline or {}).get('results', {}).get(path, {})
+        cells = []
+        for metric in METRICS:
+            value = current.get(metric)
+            if value is None:
+                cells.append(f"{'-':>15}")
+            elif old.get(metric):
+                cells.append(f"{value:>9g} {(value / old[metric] - 1) * 100:+4.0f}%")
+            else:
+                cells.append(f"{value:>15g}")
+        print(f"{path:<15} " + ' '.join(cells))
+    for stage, summary in results['stages'].items():
+        print(f"  {stage:<13} count {summary['count']:>8}  total {summary['total_ms']:>10.1f} ms  "
+              f"p50 {summary['p50_us']:>9.2f} us  p99 {summary['p99_us']:>9.2f} us")
+    if baseline is not None and baseline.get('parameters') != results['parameters']:
+        print("Note: baseline was run with different parameters.")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--orders', type=int, default=20000, help='requests in the generated flow')
+    parser.add_argument('--symbols', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='normal',
+                        help='distribution of limit prices around the mid')
+    parser.add_argument('--spread', type=float, default=20.0, help='price distribution scale in ticks')
+    parser.add_argument('--cancel-ratio', type=float, default=0.1)
+    parser.add_argument('--crossing-rate', type=float, default=0.1)
+    parser.add_argument('--sweep', type=int, default=1000, help='orders between match_orders() sweeps')
+    parser.add_argument('--queries', type=int, default=5000, help='get_order_book() calls')
+    parser.add_argument('--depth', type=int, default=10, help='levels per side in book queries')
+    parser.add_argument('--durability', choices=('commit', 'group'), default='commit')
+    parser.add_argument('--stages', action='store_true', help='include per-stage metrics')
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help='skip the tracemalloc pass')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='show changes against an earlier results file')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    results = run(args)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
@@ -0,0 +1,59 @@
+# benchmarks/order_flow.py
+"""Seeded synthetic order flow for benchmarks.
+
+generate() yields a reproducible stream of requests:
+
+    ('new', order_type, symbol, price, quantity)
+    ('cancel', index)   # index of an earlier 'new' request in the stream
+
+The same arguments always produce the same stream, so runs on different
+versions of the code replay identical flow.
+"""
+
+import random
+
+DISTRIBUTIONS = ('normal', 'uniform', 'exponential')
+
+TICK = 0.01
+
+def _distance(rng, distribution, spread):
+    """Distance from the mid in ticks, at least one tick."""
+    if distribution == 'normal':
+        ticks = abs(rng.gauss(0, spread))
+    elif distribution == 'uniform':
+        ticks = rng.uniform(0, 2 * spread)
+    else:
+        ticks = rng.expovariate(1 / spread)
+    return 1 + int(ticks)
+
+def generate(n, symbols=10, seed=0, distribution='normal', spread=20.0,
+             cancel_ratio=0.1, crossing_rate=0.1, max_quantity=100):
+    """Yield n requests over `symbols` synthetic symbols.
+
+    distribution shapes how far limit prices sit from each symbol's mid
+    price, with spread as its scale in ticks. A new order crosses the mid
+    (and so usually trades) with probability crossing_rate, otherwise it
+    rests on its own side. Each request is a cancel of a random earlier
+    order with probability cancel_ratio.
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown price distribution: {distribution}")
+    rng = random.Random(seed)
+    names = [f"SYM{i:03d}" for i in range(symbols)]
+    mids = {name: round(rng.uniform(20, 500), 2) for name in names}
+    placed = 0
+    for _ in range(n):
+        if placed and rng.random() < cancel_ratio:
+            yield ('cancel', rng.randrange(placed))
+            continue
+        symbol = rng.choice(names)
+        order_type = rng.choice(('buy', 'sell'))
+        offset = _distance(rng, distribution, spread) * TICK
+        # Resting buys sit below the mid and sells above it; crossing orders the other way
+        if (order_type == 'buy') == (rng.random() < crossing_rate):
+            price = mids[symbol] + offset
+        else:
+            price = mids[symbol] - offset
+        price = round(max(price, TICK), 2)
+        yield ('new', order_type, symbol, price, rng.randint(1, max_quantity))
+        placed += 1
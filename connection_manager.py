@@ -0,0 +1,56 @@
+# connection_manager.py
+
+import sqlite3
+import threading
+
+# Applied to every new connection. WAL lets readers (e.g. GUI refreshes)
+# proceed while the matcher writes, and synchronous=NORMAL is durable
+# against application crashes while skipping an fsync per commit.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+
+class ConnectionManager:
+    """Hand out one long-lived SQLite connection per thread.
+
+    Connections are opened lazily, tuned once, and reused for every call
+    made from the same thread. sqlite3 caches prepared statements per
+    connection, so reusing them also reuses the compiled SQL.
+    """
+
+    def __init__(self, db_file='order_book.db', cached_statements=256, timeout=5.0):
+        self.db_file = db_file
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = []
+
+    def get(self):
+        """Return the calling thread's connection, opening it if needed."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=self.timeout,
+                                   cached_statements=self.cached_statements)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                self._all.append(conn)
+        return conn
+
+    def close_all(self):
+        """Close every connection handed out so far."""
+        with self._lock:
+            conns, self._all = self._all, []
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                # Connections owned by other threads cannot be closed here;
+                # they are released when their thread exits.
+                pass
+        self._local = threading.local()
@@ -1,17 +1,47 @@
 # db_setup.py
 
+import logging
 import sqlite3
 from datetime import datetime
-import yfinance as yf
+from market_data import MarketDataService
+from metrics import configure_logging
+
+logger = logging.getLogger(__name__)
 
 def create_connection(db_file):
     """Create a database connection to a SQLite database."""
     conn = sqlite3.connect(db_file)
     return conn
 
+# How the order was handled on entry (see matching_engine.ORDER_KINDS).
+# Market orders are stored with a price of 0.
+ORDER_KIND_COLUMN = """order_kind TEXT NOT NULL DEFAULT 'limit'
+                        CHECK (order_kind IN ('limit', 'market', 'ioc', 'fok'))"""
+
+# When the order was entered, and when it was last amended or cancelled.
+# timestamp is the order's time priority, which a price amend resets, so
+# it cannot tell history queries either time.
+ORDER_TIME_COLUMNS = ('entered_at TEXT', 'updated_at TEXT')
+
+# OHLCV rollups of trades, maintained by bars.BarAggregator; the key
+# order serves range queries for one symbol and interval
+BARS_TABLE = """CREATE TABLE IF NOT EXISTS bars (
+                    symbol TEXT NOT NULL,
+                    interval INTEGER NOT NULL,
+                    start TEXT NOT NULL,
+                    open REAL NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    volume REAL NOT NULL,
+                    notional REAL NOT NULL,
+                    trade_count INTEGER NOT NULL,
+                    PRIMARY KEY (symbol, interval, start)
+                  ) WITHOUT ROWID;"""
+
 def create_tables(conn):
     """Create tables in the SQLite database."""
-    orders_table = """CREATE TABLE IF NOT EXISTS orders (
+    orders_table = f"""CREATE TABLE IF NOT EXISTS orders (
                         order_id INTEGER PRIMARY KEY AUTOINCREMENT,
                         timestamp TEXT NOT NULL,
                         type TEXT NOT NULL CHECK (type IN ('buy', 'sell')),
@@ -19,7 +49,9 @@ def create_tables(conn):
                         price REAL NOT NULL,
                         quantity REAL NOT NULL,
                         status TEXT NOT NULL CHECK (status IN ('open', 'partial', 'filled', 'cancelled')),
-                        filled_qty REAL NOT NULL DEFAULT 0
+                        filled_qty REAL NOT NULL DEFAULT 0,
+                        {ORDER_KIND_COLUMN},
+                        {', '.join(ORDER_TIME_COLUMNS)}
                       );"""
 
     trades_table = """CREATE TABLE IF NOT EXISTS trades (
@@ -45,41 +77,85 @@ def create_tables(conn):
     cursor.execute(trades_table)
     cursor.execute(stocks_table)
     conn.commit()
+    migrate(conn)
+
+def migrate(conn):
+    """Bring tables created by older versions up to date; safe to run repeatedly.
 
-def preload_stocks_and_orders(conn):
-    """Fetch stock data from yfinance and preload stocks and multiple orders."""
+    Adds the order_kind and order time columns, the bars table and the
+    secondary indexes to a database created before they existed. Existing
+    orders get their timestamp as entry time, the best one on record.
+    """
+    cursor = conn.cursor()
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(orders)")}
+    if 'order_kind' not in columns:
+        cursor.execute(f"ALTER TABLE orders ADD COLUMN {ORDER_KIND_COLUMN}")
+    for column in ORDER_TIME_COLUMNS:
+        if column.split()[0] not in columns:
+            cursor.execute(f"ALTER TABLE orders ADD COLUMN {column}")
+    if 'entered_at' not in columns:
+        cursor.execute("UPDATE orders SET entered_at = timestamp")
+    cursor.execute(BARS_TABLE)
+    conn.commit()
+    create_indexes(conn)
+
+# Secondary indexes for the queries the code runs. The open-order index is
+# partial, so it holds only live orders and filled or cancelled orders cost
+# nothing to keep out of it; its predicate must match the queries' filter
+# exactly for SQLite to use it.
+INDEXES = (
+    # Engine start-up and open order listing: WHERE status IN ('open', 'partial') ORDER BY timestamp
+    """CREATE INDEX IF NOT EXISTS idx_orders_open_time
+       ON orders (timestamp, order_id) WHERE status IN ('open', 'partial')""",
+    # Trade history, newest first
+    """CREATE INDEX IF NOT EXISTS idx_trades_time
+       ON trades (timestamp)""",
+)
+
+# Indexes created by earlier versions that no query uses
+OBSOLETE_INDEXES = ('idx_orders_book', 'idx_orders_status_time', 'idx_trades_symbol_time')
+
+def create_indexes(conn):
+    """Create secondary indexes and drop obsolete ones; safe to run against an existing database."""
+    cursor = conn.cursor()
+    for name in OBSOLETE_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+    for index in INDEXES:
+        cursor.execute(index)
+    cursor.execute("PRAGMA optimize")
+    conn.commit()
+
+def preload_stocks_and_orders(conn, market_data=None):
+    """Fetch stock data and preload stocks and multiple orders."""
     stock_symbols = ['AAPL', 'GOOGL', 'AMZN', 'MSFT', 'TSLA']
     stocks = []
     orders = []
     timestamp = datetime.utcnow().isoformat()
 
+    market_data = market_data or MarketDataService()
+    prices = market_data.get_prices(stock_symbols)
+    names = market_data.get_names(list(prices))
+
     for symbol in stock_symbols:
-        try:
-            ticker = yf.Ticker(symbol)
-            # Get live price data
-            data = ticker.history(period='1d')
-            if data.empty:
-                print(f"No data found for {symbol}. Skipping.")
-                continue
-            current_price = data['Close'][0]
-            name = ticker.info.get('shortName', symbol)
-            stocks.append((symbol, name, current_price))
-
-            # Generate 5 bid and ask orders around the current price
-            for i in range(1, 6):
-                # Simulate market makers with different prices and quantities
-                bid_price = round(current_price * (1 - 0.005 * i), 2)  # Decrease by 0.5% each step
-                ask_price = round(current_price * (1 + 0.005 * i), 2)  # Increase by 0.5% each step
-                bid_quantity = 100 + i * 10  # Increase quantity by 10 each step
-                ask_quantity = 100 + i * 15  # Increase quantity by 15 each step
-
-                # Create bid orders (Buy)
-                orders.append((timestamp, 'buy', symbol, bid_price, bid_quantity, 'open', 0))
-
-                # Create ask orders (Sell)
-                orders.append((timestamp, 'sell', symbol, ask_price, ask_quantity, 'open', 0))
-        except Exception as e:
-            print(f"Error fetching data for {symbol}: {e}")
+        current_price = prices.get(symbol)
+        if current_price is None:
+            logger.warning("No data found for %s. Skipping.", symbol)
+            continue
+        stocks.append((symbol, names[symbol], current_price))
+
+        # Generate 5 bid and ask orders around the current price
+        for i in range(1, 6):
+            # Simulate market makers with different prices and quantities
+            bid_price = round(current_price * (1 - 0.005 * i), 2)  # Decrease by 0.5% each step
+            ask_price = round(current_price * (1 + 0.005 * i), 2)  # Increase by 0.5% each step
+            bid_quantity = 100 + i * 10  # Increase quantity by 10 each step
+            ask_quantity = 100 + i * 15  # Increase quantity by 15 each step
+
+            # Create bid orders (Buy)
+            orders.append((timestamp, 'buy', symbol, bid_price, bid_quantity, 'open', 0))
+
+            # Create ask orders (Sell)
+            orders.append((timestamp, 'sell', symbol, ask_price, ask_quantity, 'open', 0))
 
     cursor = conn.cursor()
     # Insert stocks into the stocks table
@@ -90,14 +166,15 @@ def preload_stocks_and_orders(conn):
 
     # Insert orders into the orders table
     cursor.executemany("""
-        INSERT INTO orders (timestamp, type, symbol, price, quantity, status, filled_qty)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO orders (timestamp, type, symbol, price, quantity, status, filled_qty, entered_at)
+        VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, ?1)
     """, orders)
 
     conn.commit()
-    print("Stocks and initial orders pre-loaded into the database.")
+    logger.info("Stocks and initial orders pre-loaded into the database.")
 
 if __name__ == '__main__':
+    configure_logging()
     conn = create_connection('order_book.db')
     create_tables(conn)
     preload_stocks_and_orders(conn)
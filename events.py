@@ -0,0 +1,145 @@
+# events.py
+
+import itertools
+import logging
+import queue
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Event kinds published by order_book
+ORDER_ACCEPTED = 'order_accepted'
+FILL = 'fill'
+CANCEL = 'cancel'
+AMEND = 'amend'
+LEVEL_CHANGE = 'level_change'
+EVENT_KINDS = (ORDER_ACCEPTED, FILL, CANCEL, AMEND, LEVEL_CHANGE)
+
+# What to do when a subscriber's queue is full:
+#   'block'       - the publisher waits for room (backpressure on the matcher)
+#   'drop_oldest' - discard the oldest queued event to make room
+#   'drop_newest' - discard the event being published
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'drop_newest')
+
+Event = namedtuple('Event', 'seq kind data')
+
+# Seconds a blocked publisher waits before checking whether the subscription closed
+BLOCK_POLL_INTERVAL = 0.1
+
+class Subscription:
+    """A bounded queue of events for one subscriber."""
+
+    def __init__(self, bus, kinds, maxsize, policy):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.bus = bus
+        self.kinds = frozenset(kinds) if kinds else None
+        self.policy = policy
+        self.queue = queue.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def wants(self, kind):
+        return self.kinds is None or kind in self.kinds
+
+    def offer(self, event):
+        if self.policy == 'block':
+            # Wake up now and then, so closing a full subscription releases the publisher
+            while not self.closed:
+                try:
+                    self.queue.put(event, timeout=BLOCK_POLL_INTERVAL)
+                    return
+                except queue.Full:
+                    pass
+            return
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                self.dropped += 1
+                if self.policy == 'drop_newest':
+                    return
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Return the next event, or None if none arrived within timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        """Return every event currently queued."""
+        events = []
+        while True:
+            try:
+                events.append(self.queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+class EventBus:
+    """In-process publish/subscribe feed of order book events.
+
+    Each subscriber gets its own bounded queue and overflow policy, so a
+    slow consumer can only slow the publisher if it asked for 'block'.
+    Publishing with no subscribers costs a single check.
+    """
+
+    def __init__(self):
+        self._subscriptions = ()
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+
+    @property
+    def active(self):
+        return bool(self._subscriptions)
+
+    def subscribe(self, callback=None, kinds=None, maxsize=10000, policy='block'):
+        """Subscribe to events of the given kinds (all kinds by default).
+
+        Without a callback, read events from the returned Subscription. With
+        one, a daemon thread delivers each event to callback(event).
+        """
+        subscription = Subscription(self, kinds, maxsize, policy)
+        with self._lock:
+            self._subscriptions = self._subscriptions + (subscription,)
+        if callback is not None:
+            threading.Thread(target=self._dispatch, args=(subscription, callback), daemon=True).start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+        subscription.closed = True
+        # Wake a dispatcher thread waiting on an empty queue
+        try:
+            subscription.queue.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def _dispatch(self, subscription, callback):
+        while not subscription.closed:
+            event = subscription.queue.get()
+            if event is None:
+                continue
+            try:
+                callback(event)
+            except Exception:
+                logger.exception("Event subscriber failed on %s", event.kind)
+
+    def publish(self, kind, data):
+        subscriptions = self._subscriptions
+        if not subscriptions:
+            return
+        event = Event(next(self._seq), kind, data)
+        for subscription in subscriptions:
+            if subscription.wants(kind):
+                subscription.offer(event)
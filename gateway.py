@@ -0,0 +1,347 @@
+# gateway.py
+"""Asyncio order entry gateway over TCP or a Unix socket.
+
+Clients pick a protocol with the first byte they send:
+
+* Newline-delimited JSON. Requests are
+  {"op": "new", "id": 1, "type": "buy", "symbol": "AAPL", "price": 100.0, "quantity": 10},
+  optionally with "kind": "market", "ioc" or "fok" (market orders need no price),
+  {"op": "cancel", "id": 2, "order_id": 17} and
+  {"op": "amend", "id": 3, "order_id": 17, "price": 99.5, "quantity": 5}
+  (either of price and quantity may be left out). Replies are objects with
+  op "ack", "fill", "cancelled", "amended" or "reject", echoing the
+  client's id. The unfilled part of a market, IOC or FOK order is
+  reported as "cancelled" after its fills. A request that was applied to
+  the book but could not be written to the database is followed by an
+  "error" reply.
+* A compact binary protocol. The client first sends BINARY_MAGIC, then
+  fixed-size little-endian frames described by the structs below.
+
+Requests from every connection go through one queue to a single
+matching task. That task takes everything queued (up to batch_size) in
+one go, writes the batch to the database, then sends the replies. So
+one event-loop tick can serve many pipelined client orders.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import struct
+
+import order_book
+from matching_engine import ORDER_KINDS
+from metrics import configure_logging
+from persistence import PersistenceError
+
+logger = logging.getLogger(__name__)
+
+BINARY_MAGIC = b'\xb1'
+
+# Binary requests
+NEW_ORDER = struct.Struct('<BBI8sdd')    # kind=1, side (0 buy, 1 sell) | ORDER_KINDS index << 1,
+                                         # client id, symbol, price, quantity
+CANCEL = struct.Struct('<BxIq')          # kind=2, client id, order_id
+AMEND = struct.Struct('<BxIqdd')         # kind=7, client id, order_id, price, quantity (0 = unchanged)
+# Binary replies
+ACK = struct.Struct('<BIq')              # kind=3, client id, order_id
+FILL = struct.Struct('<BIqqdd')          # kind=4, client id, order_id, trade_id, price, quantity
+REJECT = struct.Struct('<BI')            # kind=5, client id
+CANCELLED = struct.Struct('<BIq')        # kind=6, client id, order_id
+AMENDED = struct.Struct('<BIq')          # kind=8, client id, order_id
+ERROR = struct.Struct('<BI')             # kind=9, client id: applied to the book but not persisted
+
+(KIND_NEW, KIND_CANCEL, KIND_ACK, KIND_FILL, KIND_REJECT, KIND_CANCELLED, KIND_AMEND, KIND_AMENDED,
+ KIND_ERROR) = range(1, 10)
+SIDES = ('buy', 'sell')
+
+class Session:
+    """One client connection and the encoder for its protocol."""
+
+    def __init__(self, writer, binary):
+        self.writer = writer
+        self.binary = binary
+        # order_id -> client id of orders entered on this session
+        self.client_ids = {}
+
+    def send_ack(self, client_id, order_id):
+        self.client_ids[order_id] = client_id
+        if self.binary:
+            self.writer.write(ACK.pack(KIND_ACK, client_id, order_id))
+        else:
+            self._send_json({'op': 'ack', 'id': client_id, 'order_id': order_id})
+
+    def send_fill(self, order_id, fill):
+        client_id = self.client_ids.get(order_id, 0)
+        remaining = fill.buy_remaining if order_id == fill.buy_order_id else fill.sell_remaining
+        if not remaining:
+            self.client_ids.pop(order_id, None)
+        if self.binary:
+            self.writer.write(FILL.pack(KIND_FILL, client_id, order_id, fill.trade_id,
+                                        fill.price, fill.quantity))
+        else:
+            self._send_json({'op': 'fill', 'id': client_id, 'order_id': order_id,
+                             'trade_id': fill.trade_id, 'symbol': fill.symbol,
+                             'price': fill.price, 'quantity': fill.quantity,
+                             'remaining': remaining})
+
+    def send_cancelled(self, client_id, order_id):
+        self.client_ids.pop(order_id, None)
+        if self.binary:
+            self.writer.write(CANCELLED.pack(KIND_CANCELLED, client_id, order_id))
+        else:
+            self._send_json({'op': 'cancelled', 'id': client_id, 'order_id': order_id})
+
+    def send_amended(self, client_id, order_id):
+        if self.binary:
+            self.writer.write(AMENDED.pack(KIND_AMENDED, client_id, order_id))
+        else:
+            self._send_json({'op': 'amended', 'id': client_id, 'order_id': order_id})
+
+    def send_reject(self, client_id, reason):
+        if self.binary:
+            self.writer.write(REJECT.pack(KIND_REJECT, client_id))
+        else:
+            self._send_json({'op': 'reject', 'id': client_id, 'reason': reason})
+
+    def send_error(self, client_id, reason):
+        if self.binary:
+            self.writer.write(ERROR.pack(KIND_ERROR, client_id))
+        else:
+            self._send_json({'op': 'error', 'id': client_id, 'reason': reason})
+
+    def _send_json(self, message):
+        self.writer.write(json.dumps(message).encode() + b'\n')
+
+class OrderGateway:
+    """Accept orders from local clients and feed them to a single matching task."""
+
+    def __init__(self, batch_size=1000, queue_size=100000):
+        self.batch_size = batch_size
+        self.queue = asyncio.Queue(queue_size)
+        # order_id -> Session that entered it, for routing fills to both sides
+        self.owners = {}
+        self._matcher = None
+        self._dirty = set()
+        # (session, client id) of requests applied to the book since the last
+        # successful write, and of those whose write failed
+        self._accepted = []
+        self._lost = []
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None):
+        """Start listening on a Unix socket if path is given, otherwise TCP.
+
+        The process-wide writer is used as configured. The gateway flushes
+        after every batch anyway, so 'group' durability (see
+        order_book.configure_persistence) saves a commit per request.
+        """
+        self._matcher = asyncio.ensure_future(self._match_loop())
+        if path is not None:
+            return await asyncio.start_unix_server(self._handle_client, path=path)
+        return await asyncio.start_server(self._handle_client, host, port)
+
+    async def _handle_client(self, reader, writer):
+        first = await reader.read(1)
+        if not first:
+            writer.close()
+            return
+        session = Session(writer, binary=(first == BINARY_MAGIC))
+        try:
+            if session.binary:
+                await self._read_binary(reader, session)
+            else:
+                await self._read_json(reader, session, first)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for order_id in session.client_ids:
+                self.owners.pop(order_id, None)
+            writer.close()
+
+    async def _read_json(self, reader, session, first):
+        line = first + await reader.readline()
+        while line:
+            if line.strip():
+                client_id = 0
+                try:
+                    message = json.loads(line)
+                    # Taken first so a request that fails below is rejected under its own id
+                    client_id = message.get('id', 0)
+                    if message.get('op') == 'cancel':
+                        request = ('cancel', client_id, int(message['order_id']))
+                    elif message.get('op') == 'amend':
+                        price, quantity = message.get('price'), message.get('quantity')
+                        request = ('amend', client_id, int(message['order_id']),
+                                   None if price is None else float(price),
+                                   None if quantity is None else float(quantity))
+                    else:
+                        request = ('new', client_id, message['type'], message['symbol'],
+                                   float(message.get('price', 0)), float(message['quantity']),
+                                   message.get('kind', 'limit'))
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    session.send_reject(client_id, f"bad request: {e}")
+                else:
+                    await self.queue.put((session, request))
+            line = await reader.readline()
+
+    async def _read_binary(self, reader, session):
+        while True:
+            kind = await reader.read(1)
+            if not kind:
+                return
+            if kind[0] == KIND_NEW:
+                _, side, client_id, symbol, price, quantity = NEW_ORDER.unpack(
+                    kind + await reader.readexactly(NEW_ORDER.size - 1))
+                if side >> 1 >= len(ORDER_KINDS):
+                    session.send_reject(client_id, 'bad order kind')
+                    continue
+                try:
+                    symbol = symbol.rstrip(b'\0').decode()
+                except UnicodeDecodeError:
+                    session.send_reject(client_id, 'bad symbol')
+                    continue
+                request = ('new', client_id, SIDES[side & 1], symbol, price, quantity, ORDER_KINDS[side >> 1])
+            elif kind[0] == KIND_CANCEL:
+                _, client_id, order_id = CANCEL.unpack(kind + await reader.readexactly(CANCEL.size - 1))
+                request = ('cancel', client_id, order_id)
+            elif kind[0] == KIND_AMEND:
+                _, client_id, order_id, price, quantity = AMEND.unpack(
+                    kind + await reader.readexactly(AMEND.size - 1))
+                request = ('amend', client_id, order_id, price or None, quantity or None)
+            else:
+                # The stream cannot be resynchronised after an unknown frame
+                session.send_reject(0, 'bad frame')
+                return
+            await self.queue.put((session, request))
+
+    async def _match_loop(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            replies = [self._safe_process(session, request) for session, request in batch]
+            # Group commit: the whole batch is durable before anyone hears back
+            try:
+                order_book.flush()
+            except PersistenceError as e:
+                self._persist_failed(e)
+            self._accepted = []
+            for reply in replies:
+                reply()
+            lost, self._lost = self._lost, []
+            for session, client_id, reason in lost:
+                self._dirty.add(session)
+                session.send_error(client_id, reason)
+            sessions, self._dirty = self._dirty, set()
+            for session in sessions:
+                try:
+                    await session.writer.drain()
+                except ConnectionError:
+                    pass
+
+    def _safe_process(self, session, request):
+        # Keep the single matching task alive whatever one request does
+        try:
+            reply = self._process(session, request)
+        except PersistenceError as e:
+            # Raised by the write after the engine took the request, so this
+            # is not a reject; the requests written with it are lost too
+            self._persist_failed(e)
+            reason = f"not persisted: {e}"
+            return lambda: session.send_error(request[1], reason)
+        except Exception as e:
+            reason = f"internal error: {e}"
+            return lambda: session.send_reject(request[1], reason)
+        if not order_book.get_writer().pending:
+            # Written by this request's commit, along with everything before it
+            self._accepted = []
+        return reply
+
+    def _persist_failed(self, error):
+        logger.error("Gateway requests applied to the book were not persisted: %s", error)
+        reason = f"not persisted: {error}"
+        self._lost.extend((session, client_id, reason) for session, client_id in self._accepted)
+        self._accepted = []
+
+    def _process(self, session, request):
+        """Apply one request to the book and return a callable sending its replies."""
+        if request[0] == 'cancel':
+            _, client_id, order_id = request
+            self._dirty.add(session)
+            if order_book.cancel_order(order_id):
+                self.owners.pop(order_id, None)
+                self._accepted.append((session, client_id))
+                return lambda: session.send_cancelled(client_id, order_id)
+            return lambda: session.send_reject(client_id, f"order {order_id} cannot be cancelled")
+
+        if request[0] == 'amend':
+            _, client_id, order_id, price, quantity = request
+            self._dirty.add(session)
+            try:
+                fills = order_book.amend_order(order_id, price, quantity, match=True)
+            except ValueError as e:
+                reason = str(e)
+                return lambda: session.send_reject(client_id, reason)
+            if fills is None:
+                return lambda: session.send_reject(client_id, f"order {order_id} cannot be amended")
+            self._accepted.append((session, client_id))
+
+            def reply():
+                session.send_amended(client_id, order_id)
+                self._route_fills(fills)
+            return reply
+
+        _, client_id, order_type, symbol, price, quantity, order_kind = request
+        self._dirty.add(session)
+        try:
+            order_id, fills = order_book.submit_order(order_type, symbol, price, quantity, order_kind)
+        except ValueError as e:
+            reason = str(e)
+            return lambda: session.send_reject(client_id, reason)
+        self.owners[order_id] = session
+        self._accepted.append((session, client_id))
+
+        def reply():
+            session.send_ack(client_id, order_id)
+            self._route_fills(fills)
+            if order_kind != 'limit' and order_id in self.owners:
+                # Still owned means part of it went unfilled and was cancelled
+                del self.owners[order_id]
+                session.send_cancelled(client_id, order_id)
+        return reply
+
+    def _route_fills(self, fills):
+        """Send each fill to the sessions that own its buy and sell orders."""
+        for fill in fills:
+            for filled_id in (fill.buy_order_id, fill.sell_order_id):
+                owner = self.owners.get(filled_id)
+                if owner is not None:
+                    self._dirty.add(owner)
+                    owner.send_fill(filled_id, fill)
+                    remaining = fill.buy_remaining if filled_id == fill.buy_order_id else fill.sell_remaining
+                    if not remaining:
+                        del self.owners[filled_id]
+
+async def main(host, port, path, metrics_path):
+    if metrics_path:
+        order_book.enable_metrics().dump_on_signal(metrics_path)
+    order_book.configure_persistence(durability='group')
+    gateway = OrderGateway()
+    server = await gateway.serve(host, port, path)
+    print(f"Order gateway listening on {path or f'{host}:{port}'}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the order entry gateway.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', dest='path', help='listen on this Unix socket instead of TCP')
+    parser.add_argument('--metrics', dest='metrics_path',
+                        help='record stage metrics and write them to this file on SIGUSR1')
+    args = parser.parse_args()
+    configure_logging()
+    asyncio.run(main(args.host, args.port, args.path, args.metrics_path))
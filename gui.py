@@ -1,9 +1,17 @@
 # gui.py
 
+import queue
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox
-from order_book import place_order, match_orders, cancel_order, get_stock_symbols, get_order_book, get_trades, update_stock_prices
-import sqlite3
+from metrics import configure_logging
+from matching_engine import ORDER_KINDS
+from order_book import place_order, match_orders, cancel_order, get_stock_symbols, get_order_book, get_trades, update_stock_prices, set_continuous_matching, get_book_version, flush
+
+# Rows of trade history shown per page
+TRADES_PAGE_SIZE = 200
+# Auto refresh period in milliseconds
+AUTO_REFRESH_MS = 1000
 
 class OrderBookGUI:
     def __init__(self, master):
@@ -11,18 +19,33 @@ class OrderBookGUI:
         master.title("Order Book Management System")
         master.geometry("800x600")
 
+        # Every order book call runs on this single worker thread, so the
+        # engine is only touched from one thread and Tk never blocks on it.
+        # Results come back through a queue drained on the Tk thread.
+        self.worker = ThreadPoolExecutor(max_workers=1)
+        self.results = queue.Queue()
+        self.tree_rows = {}
+        self.trades_offset = 0
+        self.auto_refresh_job = None
+
         # Fetch stock symbols
         self.symbols = get_stock_symbols()
 
         # Create variables
         self.order_type = tk.StringVar(value="buy")
+        self.order_kind = tk.StringVar(value="limit")
         self.symbol = tk.StringVar(value=self.symbols[0] if self.symbols else "")
         self.price = tk.DoubleVar()
         self.quantity = tk.DoubleVar()
         self.selected_symbol = tk.StringVar(value=self.symbols[0] if self.symbols else "")
+        self.match_on_entry = tk.BooleanVar(value=False)
+        self.auto_refresh = tk.BooleanVar(value=False)
+        self.drawn_book = None
 
         # Create widgets
         self.create_widgets()
+        self.poll_results()
+        master.protocol("WM_DELETE_WINDOW", self.close)
 
     def create_widgets(self):
         # Order Placement Frame
@@ -33,6 +56,8 @@ class OrderBookGUI:
         ttk.Label(order_frame, text="Order Type:").grid(row=0, column=0, sticky='e', padx=5, pady=5)
         ttk.Radiobutton(order_frame, text="Buy", variable=self.order_type, value="buy").grid(row=0, column=1, sticky='w')
         ttk.Radiobutton(order_frame, text="Sell", variable=self.order_type, value="sell").grid(row=0, column=2, sticky='w')
+        ttk.Combobox(order_frame, textvariable=self.order_kind, values=ORDER_KINDS, state='readonly',
+                     width=8).grid(row=0, column=3, sticky='w', padx=5)
 
         # Symbol
         ttk.Label(order_frame, text="Symbol:").grid(row=1, column=0, sticky='e', padx=5, pady=5)
@@ -55,6 +80,10 @@ class OrderBookGUI:
         self.place_order_button = ttk.Button(order_frame, text="Place Order", command=self.place_order)
         self.place_order_button.grid(row=4, column=1, pady=10, sticky='e')
 
+        # Match on Entry Toggle
+        ttk.Checkbutton(order_frame, text="Match on Entry", variable=self.match_on_entry,
+                        command=lambda: self.run_in_background(set_continuous_matching, self.match_on_entry.get())).grid(row=4, column=2, sticky='w')
+
         # Select Symbol for Order Book
         ttk.Label(order_frame, text="Order Book Symbol:").grid(row=5, column=0, sticky='e', padx=5, pady=5)
         self.order_book_symbol_combo = ttk.Combobox(order_frame, textvariable=self.selected_symbol)
@@ -102,6 +131,10 @@ class OrderBookGUI:
         self.update_prices_button = ttk.Button(controls_frame, text="Update Prices", command=self.update_prices)
         self.update_prices_button.pack(side='left', padx=5)
 
+        # Auto Refresh Toggle
+        ttk.Checkbutton(controls_frame, text="Auto Refresh", variable=self.auto_refresh,
+                        command=self.schedule_auto_refresh).pack(side='left', padx=5)
+
         # Trades Frame
         trades_frame = ttk.LabelFrame(self.master, text="Trade History")
         trades_frame.pack(fill='both', expand=True, padx=10, pady=5)
@@ -115,78 +148,159 @@ class OrderBookGUI:
         self.trades_tree.heading('Quantity', text='Quantity')
         self.trades_tree.pack(fill='both', expand=True)
 
+        # Trade History Paging
+        trades_controls = ttk.Frame(trades_frame)
+        trades_controls.pack(pady=5)
+        ttk.Button(trades_controls, text="Newer", command=lambda: self.page_trades(-1)).pack(side='left', padx=5)
+
         # Refresh Trades Button
-        self.refresh_trades_button = ttk.Button(trades_frame, text="Refresh Trades", command=self.refresh_trades)
-        self.refresh_trades_button.pack(pady=5)
+        self.refresh_trades_button = ttk.Button(trades_controls, text="Refresh Trades", command=self.refresh_trades)
+        self.refresh_trades_button.pack(side='left', padx=5)
+        ttk.Button(trades_controls, text="Older", command=lambda: self.page_trades(1)).pack(side='left', padx=5)
 
         # Initial refresh
         self.refresh_order_book()
         self.refresh_trades()
 
 
+    def run_in_background(self, func, *args, callback=None, error=None):
+        """Run func(*args) on the worker thread and hand the result to callback on the Tk thread."""
+        def job():
+            try:
+                self.results.put((callback, func(*args), None))
+            except Exception as e:
+                self.results.put((error, None, e))
+        self.worker.submit(job)
+
+    def poll_results(self):
+        """Apply finished background results on the Tk thread."""
+        while True:
+            try:
+                callback, result, exc = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if exc is not None:
+                if callback is not None:
+                    callback(exc)
+                else:
+                    messagebox.showerror("Error", str(exc))
+            elif callback is not None:
+                callback(result)
+        self.master.after(50, self.poll_results)
+
+    def sync_tree(self, tree, rows):
+        """Update a Treeview to show rows [(iid, values)] touching only what changed."""
+        drawn = self.tree_rows.setdefault(tree, {})
+        wanted = dict(rows)
+        for iid in list(drawn):
+            if iid not in wanted:
+                tree.delete(iid)
+                del drawn[iid]
+        for index, (iid, values) in enumerate(rows):
+            if iid not in drawn:
+                tree.insert('', index, iid=iid, values=values)
+            else:
+                if drawn[iid] != values:
+                    tree.item(iid, values=values)
+                if tree.index(iid) != index:
+                    tree.move(iid, '', index)
+            drawn[iid] = values
+
     def place_order(self):
         """Event handler for placing an order."""
         order_type = self.order_type.get()
+        order_kind = self.order_kind.get()
         symbol = self.symbol.get().upper()
         try:
-            price = float(self.price.get())
+            # Market orders take whatever price the book offers
+            price = 0.0 if order_kind == 'market' else float(self.price.get())
             quantity = float(self.quantity.get())
-            if price <= 0 or quantity <= 0:
+            if (price <= 0 and order_kind != 'market') or quantity <= 0:
                 raise ValueError
-            place_order(order_type, symbol, price, quantity)
+        except (ValueError, tk.TclError):
+            messagebox.showerror("Error", "Please enter valid price and quantity.")
+            return
+
+        def placed(order_id):
             messagebox.showinfo("Success", "Order placed successfully.")
             self.refresh_order_book()
-        except ValueError:
-            messagebox.showerror("Error", "Please enter valid price and quantity.")
+            if self.match_on_entry.get() or order_kind != 'limit':
+                self.refresh_trades()
+
+        self.run_in_background(place_order, order_type, symbol, price, quantity, order_kind, callback=placed)
 
     def refresh_order_book(self):
         """Refresh the order book display for the selected symbol."""
         symbol = self.selected_symbol.get().upper()
+        drawn_book = self.drawn_book
+
+        def load():
+            # Skip the query if the book has not changed since it was drawn
+            version = (symbol, get_book_version(symbol))
+            if version == drawn_book:
+                return version, None
+            return version, get_order_book(symbol)
+
+        self.run_in_background(load, callback=self.show_order_book)
+
+    def show_order_book(self, result):
+        version, book = result
+        if book is None:
+            return
+        self.drawn_book = version
+        bids, asks = book
+        self.sync_tree(self.bids_tree, [(str(price), (price, qty)) for price, qty in bids])
+        self.sync_tree(self.asks_tree, [(str(price), (price, qty)) for price, qty in asks])
 
-        # Clear current contents
-        for row in self.bids_tree.get_children():
-            self.bids_tree.delete(row)
-        for row in self.asks_tree.get_children():
-            self.asks_tree.delete(row)
+    def match_orders(self):
+        """Event handler for matching orders."""
+        def matched(fills):
+            messagebox.showinfo("Info", "Order matching completed.")
+            self.refresh_order_book()
+            self.refresh_trades()
 
-        # Get order book data
-        bids, asks = get_order_book(symbol)
+        self.run_in_background(match_orders, callback=matched)
 
-        # Insert bids into the treeview
-        for price, qty in bids:
-            self.bids_tree.insert('', 'end', values=(price, qty))
+    def refresh_trades(self):
+        """Refresh the trade history display with the current page."""
+        self.run_in_background(get_trades, TRADES_PAGE_SIZE, self.trades_offset,
+                               callback=self.show_trades)
 
-        # Insert asks into the treeview
-        for price, qty in asks:
-            self.asks_tree.insert('', 'end', values=(price, qty))
+    def show_trades(self, trades):
+        self.sync_tree(self.trades_tree, [(str(trade[0]), tuple(trade)) for trade in trades])
 
-    def match_orders(self):
-        """Event handler for matching orders."""
-        match_orders()
-        messagebox.showinfo("Info", "Order matching completed.")
+    def page_trades(self, step):
+        """Move the trade history window by step pages (negative is newer)."""
+        self.trades_offset = max(0, self.trades_offset + step * TRADES_PAGE_SIZE)
+        self.refresh_trades()
+
+    def schedule_auto_refresh(self):
+        """Refresh the book and trades every AUTO_REFRESH_MS while enabled."""
+        if self.auto_refresh_job is not None:
+            self.master.after_cancel(self.auto_refresh_job)
+            self.auto_refresh_job = None
+        if not self.auto_refresh.get():
+            return
         self.refresh_order_book()
         self.refresh_trades()
+        self.auto_refresh_job = self.master.after(AUTO_REFRESH_MS, self.schedule_auto_refresh)
 
-    def refresh_trades(self):
-        """Refresh the trade history display."""
-        # Clear current contents
-        for row in self.trades_tree.get_children():
-            self.trades_tree.delete(row)
-
-        # Get trade history
-        trades = get_trades()
-
-        # Insert trades into the treeview
-        for trade in trades:
-            self.trades_tree.insert('', 'end', values=trade)
-    
     def update_prices(self):
         """Update stock prices from yfinance and refresh order book."""
-        update_stock_prices()
-        messagebox.showinfo("Info", "Stock prices updated.")
-        self.refresh_order_book()
+        def updated(_):
+            messagebox.showinfo("Info", "Stock prices updated.")
+            self.refresh_order_book()
+
+        self.run_in_background(update_stock_prices, callback=updated)
+
+    def close(self):
+        """Write any buffered activity and stop the worker before exiting."""
+        self.worker.submit(flush)
+        self.worker.shutdown(wait=True)
+        self.master.destroy()
 
 if __name__ == '__main__':
+    configure_logging()
     root = tk.Tk()
     app = OrderBookGUI(root)
     root.mainloop()
@@ -0,0 +1,235 @@
+# journal.py
+"""Append-only binary journal of engine inputs with periodic snapshots.
+
+Every record is a RECORD header (kind, payload length) followed by its
+payload. The journal stores the inputs the engine saw: new orders,
+cancels, amends and match sweeps. Fills are recorded too, so replay can check
+that it reproduces exactly the same trades.
+
+A snapshot is the pickled engine plus the journal offset it covers. On
+recovery the latest snapshot is loaded and only the journal after that
+offset is replayed. Start-up time therefore depends on the live book and
+the tail length, not on the full history.
+"""
+
+import os
+import pickle
+import struct
+from collections import deque
+
+from matching_engine import ORDER_KINDS, Order
+
+RECORD = struct.Struct('<BI')        # kind, payload length
+ORDER = struct.Struct('<qBqqB')      # order_id, side (0 buy, 1 sell), price ticks, quantity lots,
+                                     # matched on entry | ORDER_KINDS index << 1
+CANCEL = struct.Struct('<q')         # order_id, followed by the cancel timestamp
+FILL = struct.Struct('<qqqqq')       # trade_id, buy order_id, sell order_id, price ticks, quantity lots,
+                                     # followed by the trade timestamp
+AMEND = struct.Struct('<qqqB')       # order_id, new price ticks, new quantity lots, matched on amend,
+                                     # followed by the order's timestamp and the amend timestamp
+TEXT_LENGTH = struct.Struct('<H')    # byte length of a UTF-8 string that follows
+
+# Longest string a TEXT_LENGTH prefix can describe; order_book.validate_order
+# rejects longer symbols before the order reaches the engine
+MAX_TEXT_BYTES = (1 << 16) - 1
+# Largest price in ticks or quantity in lots the 64-bit fields can hold
+MAX_UNITS = (1 << 63) - 1
+
+KIND_ORDER, KIND_CANCEL, KIND_MATCH, KIND_FILL, KIND_AMEND = range(1, 6)
+SIDES = ('buy', 'sell')
+
+JOURNAL_FILE = 'journal.bin'
+SNAPSHOT_FILE = 'snapshot.pkl'
+
+class JournalError(Exception):
+    """Raised when replaying the journal does not reproduce the recorded fills."""
+
+class Journal:
+    """Buffered writer for the append-only journal in a directory."""
+
+    def __init__(self, directory, snapshot_interval=100000, sync=False, buffer_size=1 << 16):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.sync = sync
+        self.path = os.path.join(directory, JOURNAL_FILE)
+        self._file = open(self.path, 'ab', buffering=buffer_size)
+        self._since_snapshot = 0
+
+    def _append(self, kind, payload=b''):
+        self._file.write(RECORD.pack(kind, len(payload)) + payload)
+        self._since_snapshot += 1
+
+    def record_order(self, order, matched, kind='limit'):
+        """Record a new order; matched says whether it was matched on entry."""
+        self._append(KIND_ORDER, ORDER.pack(order.order_id, SIDES.index(order.side), order.price,
+                                            order.quantity, matched | ORDER_KINDS.index(kind) << 1)
+                     + _pack_text(order.timestamp) + _pack_text(order.symbol))
+
+    def record_cancel(self, order_id, timestamp):
+        self._append(KIND_CANCEL, CANCEL.pack(order_id) + _pack_text(timestamp))
+
+    def record_amend(self, order, matched, timestamp):
+        """Record an amend made at timestamp by the order's resulting price, quantity and timestamp."""
+        self._append(KIND_AMEND, AMEND.pack(order.order_id, order.price, order.quantity, matched)
+                     + _pack_text(order.timestamp) + _pack_text(timestamp))
+
+    def record_match(self):
+        """Record a match_orders() sweep over the pending books."""
+        self._append(KIND_MATCH)
+
+    def record_fills(self, fills):
+        """Record engine fills (prices and quantities in ticks and lots)."""
+        for fill in fills:
+            self._append(KIND_FILL, FILL.pack(fill.trade_id, fill.buy_order_id, fill.sell_order_id,
+                                              fill.price, fill.quantity) + _pack_text(fill.timestamp))
+
+    def flush(self):
+        """Hand buffered records to the OS, and fsync them if sync is set."""
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    @property
+    def snapshot_due(self):
+        """True once snapshot_interval records have been written since the last snapshot."""
+        return self._since_snapshot >= self.snapshot_interval
+
+    def snapshot(self, engine):
+        """Write the engine state and the journal offset it covers."""
+        self.flush()
+        offset = self._file.tell()
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump((offset, engine), f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._since_snapshot = 0
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+def _pack_text(value):
+    data = value.encode()
+    return TEXT_LENGTH.pack(len(data)) + data
+
+def _unpack_text(data, at):
+    """Return the string at offset at and the offset just after it."""
+    (length,) = TEXT_LENGTH.unpack_from(data, at)
+    at += TEXT_LENGTH.size
+    return data[at:at + length].decode(), at + length
+
+def read_records(path, offset=0):
+    """Yield (kind, fields, end_offset) for each complete record after offset.
+
+    A torn record at the end of the file (e.g. after a crash) ends the
+    iteration.
+    """
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    pos = 0
+    while pos + RECORD.size <= len(data):
+        kind, length = RECORD.unpack_from(data, pos)
+        start = pos + RECORD.size
+        end = start + length
+        if end > len(data):
+            return
+        if kind == KIND_ORDER:
+            order_id, side, price, quantity, matched = ORDER.unpack_from(data, start)
+            timestamp, at = _unpack_text(data, start + ORDER.size)
+            symbol, _ = _unpack_text(data, at)
+            fields = (order_id, SIDES[side], price, quantity, bool(matched & 1), timestamp, symbol,
+                      ORDER_KINDS[matched >> 1])
+        elif kind == KIND_CANCEL:
+            # Journals written before cancel times were recorded end at the order_id
+            at = start + CANCEL.size
+            fields = CANCEL.unpack_from(data, start) + (_unpack_text(data, at)[0] if at < end else None,)
+        elif kind == KIND_FILL:
+            timestamp, _ = _unpack_text(data, start + FILL.size)
+            fields = FILL.unpack_from(data, start) + (timestamp,)
+        elif kind == KIND_AMEND:
+            order_id, price, quantity, matched = AMEND.unpack_from(data, start)
+            timestamp, at = _unpack_text(data, start + AMEND.size)
+            amended_at = _unpack_text(data, at)[0] if at < end else None
+            fields = (order_id, price, quantity, bool(matched), timestamp, amended_at)
+        else:
+            fields = ()
+        yield kind, fields, offset + end
+        pos = end
+
+def has_state(directory):
+    """Return True if directory holds a snapshot to recover from."""
+    return os.path.exists(os.path.join(directory, SNAPSHOT_FILE))
+
+def recover(directory, verify=True, writer=None, persisted=(0, 0)):
+    """Rebuild an engine from the latest snapshot plus the journal tail.
+
+    With verify, every replayed fill is compared with the recorded one
+    and a mismatch raises JournalError. The journal is truncated after the
+    last complete record so new records append cleanly.
+
+    With writer (a persistence.BatchWriter), the tail is also queued for
+    writing, so a database that lags the journal catches up. persisted
+    is the database's (last order_id, last trade_id): orders and trades
+    up to those ids are already stored and are not inserted again.
+    Cancels, amends and fill states are absolute, so they are queued
+    even if the database already has them. The snapshot itself must
+    already be in the database (see order_book's snapshotting).
+    """
+    with open(os.path.join(directory, SNAPSHOT_FILE), 'rb') as f:
+        offset, engine = pickle.load(f)
+    path = os.path.join(directory, JOURNAL_FILE)
+    if not os.path.exists(path):
+        return engine
+
+    last_order_id, last_trade_id = persisted
+    expected = deque()
+    end = offset
+    for kind, fields, end in read_records(path, offset):
+        fills = ()
+        if kind == KIND_ORDER:
+            order_id, side, price, quantity, matched, timestamp, symbol, order_kind = fields
+            order = Order(order_id, timestamp, side, symbol, price, quantity)
+            engine.last_order_id = max(engine.last_order_id, order_id)
+            new = writer is not None and order_id > last_order_id
+            if new:
+                writer.add_order(order, order_kind)
+            if matched:
+                fills = engine.submit(order, order_kind)
+                if new and order_kind != 'limit' and order.remaining > 0:
+                    writer.cancel(order_id, timestamp)
+            else:
+                engine.add_order(order)
+        elif kind == KIND_CANCEL:
+            order_id, cancelled_at = fields
+            if engine.cancel(order_id) is not None and writer is not None:
+                writer.cancel(order_id, cancelled_at)
+        elif kind == KIND_AMEND:
+            order_id, price, quantity, matched, timestamp, amended_at = fields
+            order = engine.orders.get(order_id)
+            fills = engine.amend(order_id, price, quantity, timestamp, match=matched) or ()
+            if order is not None and writer is not None:
+                writer.amend(order, amended_at)
+        elif kind == KIND_MATCH:
+            fills = engine.match()
+        elif kind == KIND_FILL:
+            recorded, timestamp = fields[:-1], fields[-1]
+            if not expected:
+                if verify:
+                    raise JournalError(f"Recorded trade {recorded[0]} was not reproduced")
+                continue
+            fill = expected.popleft()
+            replayed = (fill.trade_id, fill.buy_order_id, fill.sell_order_id, fill.price, fill.quantity)
+            if verify and replayed != recorded:
+                raise JournalError(f"Replay produced {replayed}, journal has {recorded}")
+            if writer is not None and fill.trade_id > last_trade_id:
+                # Trades keep the time they happened, not the time of the replay
+                writer.add_fills([fill._replace(timestamp=timestamp)])
+        expected.extend(fills)
+    with open(path, 'r+b') as f:
+        f.truncate(end)
+    return engine
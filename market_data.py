@@ -0,0 +1,130 @@
+# market_data.py
+
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class MarketDataProvider:
+    """Source of last prices and display names for stock symbols."""
+
+    def fetch_price(self, symbol):
+        """Return the latest price for symbol, or None if there is no data."""
+        raise NotImplementedError
+
+    def fetch_name(self, symbol):
+        """Return a display name for symbol."""
+        return symbol
+
+class YFinanceProvider(MarketDataProvider):
+    """Prices from Yahoo Finance via yfinance (requires network access)."""
+
+    def __init__(self):
+        # Imported here so the rest of the app runs without yfinance installed
+        import yfinance
+        self._yf = yfinance
+
+    def fetch_price(self, symbol):
+        data = self._yf.Ticker(symbol).history(period='1d')
+        if data.empty:
+            return None
+        return float(data['Close'].iloc[0])
+
+    def fetch_name(self, symbol):
+        return self._yf.Ticker(symbol).info.get('shortName', symbol)
+
+class FakeProvider(MarketDataProvider):
+    """Offline random-walk prices with optional simulated network latency."""
+
+    def __init__(self, prices=None, latency=0.0, seed=0):
+        self.prices = dict(prices or {})
+        self.latency = latency
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def fetch_price(self, symbol):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            price = self.prices.get(symbol)
+            if price is None:
+                price = self._rng.uniform(50, 500)
+            price = round(price * (1 + self._rng.gauss(0, 0.002)), 2)
+            self.prices[symbol] = price
+        return price
+
+def default_provider():
+    """Return the provider named by ORDER_BOOK_MARKET_DATA ('yfinance' or 'fake')."""
+    if os.environ.get('ORDER_BOOK_MARKET_DATA', 'yfinance') == 'fake':
+        return FakeProvider()
+    return YFinanceProvider()
+
+class MarketDataService:
+    """Concurrent, cached price lookups on top of a MarketDataProvider.
+
+    Prices younger than ttl seconds are served from the cache. Stale
+    symbols are fetched in parallel on a thread pool, so a refresh takes
+    about as long as the slowest single symbol.
+    """
+
+    def __init__(self, provider=None, ttl=60.0, max_workers=8):
+        self.provider = provider if provider is not None else default_provider()
+        self.ttl = ttl
+        self.max_workers = max_workers
+        self._cache = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def staleness(self, symbol):
+        """Seconds since symbol was last fetched, or None if never fetched."""
+        entry = self._cache.get(symbol)
+        if entry is None:
+            return None
+        return time.monotonic() - entry[1]
+
+    def _is_fresh(self, symbol, now):
+        entry = self._cache.get(symbol)
+        return entry is not None and now - entry[1] < self.ttl
+
+    def _fetch(self, symbol):
+        try:
+            return symbol, self.provider.fetch_price(symbol), None
+        except Exception as e:
+            return symbol, None, e
+
+    def get_prices(self, symbols, force=False):
+        """Return {symbol: price} for symbols with data, fetching stale ones."""
+        now = time.monotonic()
+        stale = [s for s in symbols if force or not self._is_fresh(s, now)]
+        if stale:
+            workers = min(self.max_workers, len(stale))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(self._fetch, stale))
+            fetched_at = time.monotonic()
+            with self._lock:
+                for symbol, price, error in results:
+                    if error is not None:
+                        self.errors[symbol] = error
+                        logger.warning("Error updating price for %s: %s", symbol, error)
+                    elif price is not None:
+                        self.errors.pop(symbol, None)
+                        self._cache[symbol] = (price, fetched_at)
+        return {s: self._cache[s][0] for s in symbols if s in self._cache}
+
+    def get_names(self, symbols):
+        """Return {symbol: name}, looked up in parallel."""
+        if not symbols:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(symbols))) as pool:
+            names = pool.map(self._fetch_name, symbols)
+        return dict(zip(symbols, names))
+
+    def _fetch_name(self, symbol):
+        try:
+            return self.provider.fetch_name(symbol)
+        except Exception:
+            return symbol
@@ -0,0 +1,501 @@
+# matching_engine.py
+
+import bisect
+import itertools
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+
+# Prices and quantities are held as integers inside the engine: prices in
+# ticks of 1/PRICE_SCALE and quantities in lots of 1/QTY_SCALE. This keeps
+# level keys exact and makes "fully filled" an integer comparison.
+PRICE_SCALE = 10_000
+QTY_SCALE = 10_000
+
+def to_ticks(price):
+    return int(round(price * PRICE_SCALE))
+
+def from_ticks(ticks):
+    return ticks / PRICE_SCALE
+
+def to_lots(quantity):
+    return int(round(quantity * QTY_SCALE))
+
+def from_lots(lots):
+    return lots / QTY_SCALE
+
+# price and quantity are in ticks and lots; buy_remaining and sell_remaining
+# are each order's remaining lots after the fill.
+Fill = namedtuple('Fill', 'trade_id timestamp symbol buy_order_id sell_order_id price quantity '
+                          'buy_remaining sell_remaining')
+
+# How an incoming order is handled by MatchingEngine.submit():
+#   'limit'  - match up to the limit price and rest any remainder
+#   'market' - match at any price; the remainder is cancelled
+#   'ioc'    - immediate or cancel: match up to the limit, cancel the remainder
+#   'fok'    - fill or kill: fill completely up to the limit, or not at all
+# Only limit orders ever rest on the book.
+ORDER_KINDS = ('limit', 'market', 'ioc', 'fok')
+
+class Order:
+    """A live limit order held in memory by the matching engine.
+
+    price is in ticks and quantity/filled_qty in lots (see to_ticks and
+    to_lots). __slots__ keeps the per-order footprint small for books
+    with millions of resting orders.
+    """
+
+    __slots__ = ('order_id', 'timestamp', 'side', 'symbol', 'price', 'quantity', 'filled_qty')
+
+    def __init__(self, order_id, timestamp, side, symbol, price, quantity, filled_qty=0):
+        self.order_id = order_id
+        self.timestamp = timestamp
+        self.side = side
+        self.symbol = symbol
+        self.price = price
+        self.quantity = quantity
+        self.filled_qty = filled_qty
+
+    @property
+    def remaining(self):
+        return self.quantity - self.filled_qty
+
+    def __repr__(self):
+        return (f"Order({self.order_id}, {self.side}, {self.symbol}, "
+                f"{from_lots(self.remaining)}/{from_lots(self.quantity)} @ {from_ticks(self.price)})")
+
+class BookSide:
+    """One side of a symbol's book: FIFO queues of orders keyed by price.
+
+    Prices are kept in a sorted list whose last element is always the best
+    price, so the best level is found in O(1) and levels are added or
+    removed with a binary search. The remaining quantity at each price is
+    kept alongside, so depth can be read without walking the queues.
+
+    If listener is set it is called as listener(symbol, side, price, total)
+    whenever the total at a price changes; a total of 0 means the level
+    is gone.
+    """
+
+    def __init__(self, side, symbol=None):
+        self.side = side
+        self.symbol = symbol
+        self.levels = {}
+        self.totals = {}
+        self.listener = None
+        self._keys = []
+
+    def __getstate__(self):
+        # Listeners are process-local callbacks and are not snapshotted
+        state = self.__dict__.copy()
+        state['listener'] = None
+        return state
+
+    def _key(self, price):
+        # Bids rank highest price first, asks lowest price first.
+        return price if self.side == 'buy' else -price
+
+    def __bool__(self):
+        return bool(self._keys)
+
+    def best_price(self):
+        """Return the best price on this side, or None if it is empty."""
+        if not self._keys:
+            return None
+        key = self._keys[-1]
+        return key if self.side == 'buy' else -key
+
+    def best_level(self):
+        """Return the FIFO queue at the best price."""
+        return self.levels[self.best_price()]
+
+    def prices(self):
+        """Yield prices from best to worst."""
+        for key in reversed(self._keys):
+            yield key if self.side == 'buy' else -key
+
+    def top(self, n=None):
+        """Return up to n (price, quantity) levels, best first."""
+        return [(price, self.totals[price]) for price in itertools.islice(self.prices(), n)]
+
+    def add(self, order):
+        level = self.levels.get(order.price)
+        if level is None:
+            level = self.levels[order.price] = OrderedDict()
+            self.totals[order.price] = 0
+            bisect.insort(self._keys, self._key(order.price))
+        level[order.order_id] = order
+        self.totals[order.price] += order.remaining
+        if self.listener is not None:
+            self.listener(self.symbol, self.side, order.price, self.totals[order.price])
+
+    def reduce(self, order, quantity):
+        """Take quantity filled or cut from a resting order off its level total."""
+        self.totals[order.price] -= quantity
+        if self.listener is not None:
+            self.listener(self.symbol, self.side, order.price, self.totals[order.price])
+
+    def remove(self, order):
+        level = self.levels[order.price]
+        del level[order.order_id]
+        if not level:
+            self._drop_level(order.price)
+        elif order.remaining:
+            self.totals[order.price] -= order.remaining
+            if self.listener is not None:
+                self.listener(self.symbol, self.side, order.price, self.totals[order.price])
+
+    def _drop_level(self, price):
+        del self.levels[price]
+        del self.totals[price]
+        if self.listener is not None:
+            self.listener(self.symbol, self.side, price, 0)
+        key = self._key(price)
+        if self._keys[-1] == key:
+            self._keys.pop()
+        else:
+            del self._keys[bisect.bisect_left(self._keys, key)]
+
+class SymbolBook:
+    """Bids and asks for a single symbol with price-time priority matching.
+
+    version increases whenever the visible depth changes, so callers can
+    skip redrawing a book they have already seen.
+    """
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = BookSide('buy', symbol)
+        self.asks = BookSide('sell', symbol)
+        self.version = 0
+
+    def side(self, side):
+        return self.bids if side == 'buy' else self.asks
+
+    def crossed(self):
+        """Return True if the best bid meets or exceeds the best ask."""
+        return bool(self.bids) and bool(self.asks) and self.bids.best_price() >= self.asks.best_price()
+
+    def add(self, order):
+        self.side(order.side).add(order)
+        self.version += 1
+
+    def remove(self, order):
+        self.side(order.side).remove(order)
+        self.version += 1
+
+    def resize(self, order, quantity):
+        """Lower a resting order's total quantity without moving it in its queue."""
+        self.side(order.side).reduce(order, order.quantity - quantity)
+        order.quantity = quantity
+        self.version += 1
+
+    def match(self):
+        """Match crossing resting orders and return the resulting fills.
+
+        Fully filled orders are removed from the book; partially filled
+        orders keep their place in the queue.
+        """
+        fills = []
+        while self.crossed():
+            buy_order = next(iter(self.bids.best_level().values()))
+            sell_order = next(iter(self.asks.best_level().values()))
+            fill = self._fill(buy_order, sell_order)
+            fills.append(fill)
+            self.bids.reduce(buy_order, fill.quantity)
+            self.asks.reduce(sell_order, fill.quantity)
+            if buy_order.remaining <= 0:
+                self.bids.remove(buy_order)
+            if sell_order.remaining <= 0:
+                self.asks.remove(sell_order)
+        if fills:
+            self.version += 1
+        return fills
+
+    def match_order(self, order, rest=True, market=False):
+        """Match an incoming order against the opposite side only.
+
+        Every fill trades at the resting order's price. With market the
+        order's own price is ignored, so it trades as far into the book as
+        needed. Whatever is left of the order afterwards rests on its own
+        side if rest is True.
+        """
+        fills = []
+        opposite = self.asks if order.side == 'buy' else self.bids
+        while order.remaining > 0 and opposite:
+            best = opposite.best_price()
+            if not market:
+                if order.side == 'buy' and order.price < best:
+                    break
+                if order.side == 'sell' and order.price > best:
+                    break
+            resting = next(iter(opposite.best_level().values()))
+            if order.side == 'buy':
+                fill = self._fill(order, resting, resting.price)
+            else:
+                fill = self._fill(resting, order, resting.price)
+            fills.append(fill)
+            opposite.reduce(resting, fill.quantity)
+            if resting.remaining <= 0:
+                opposite.remove(resting)
+        if fills:
+            self.version += 1
+        if rest and order.remaining > 0:
+            self.add(order)
+        return fills
+
+    def can_fill(self, order):
+        """Return True if the opposite side holds enough quantity within order's limit.
+
+        Reads the aggregated level totals, so the cost depends on the
+        number of price levels the order would sweep, not on the orders in them.
+        """
+        opposite = self.asks if order.side == 'buy' else self.bids
+        buy = order.side == 'buy'
+        needed = order.remaining
+        for price in opposite.prices():
+            if (order.price < price) if buy else (order.price > price):
+                return False
+            needed -= opposite.totals[price]
+            if needed <= 0:
+                return True
+        return False
+
+    def _fill(self, buy_order, sell_order, price=None):
+        trade_qty = min(buy_order.remaining, sell_order.remaining)
+        # Between two resting orders the trade is at the sell order's
+        # price; an incoming order trades at the resting order's price
+        trade_price = sell_order.price if price is None else price
+        buy_order.filled_qty += trade_qty
+        sell_order.filled_qty += trade_qty
+        # trade_id is assigned by the engine once fills are merged
+        return Fill(None, datetime.utcnow().isoformat(), self.symbol, buy_order.order_id,
+                    sell_order.order_id, trade_price, trade_qty,
+                    buy_order.remaining, sell_order.remaining)
+
+    def depth(self, levels=None):
+        """Return up to `levels` aggregated (price, quantity) bids and asks, best first."""
+        return self.bids.top(levels), self.asks.top(levels)
+
+    def best_bid_ask(self):
+        return self.bids.best_price(), self.asks.best_price()
+
+    def crossing_slice(self):
+        """Return the orders that can trade against each other right now.
+
+        Bids priced at or above the best ask and asks priced at or below
+        the best bid, as (order_id, price, remaining) in priority order.
+        """
+        best_bid, best_ask = self.best_bid_ask()
+        bids = []
+        for price in self.bids.prices():
+            if price < best_ask:
+                break
+            bids.extend((o.order_id, price, o.remaining) for o in self.bids.levels[price].values())
+        asks = []
+        for price in self.asks.prices():
+            if price > best_bid:
+                break
+            asks.extend((o.order_id, price, o.remaining) for o in self.asks.levels[price].values())
+        return bids, asks
+
+    def apply_fills(self, fills, orders):
+        """Apply fills computed elsewhere (see match_crossing) to this book."""
+        for fill in fills:
+            buy_order = orders[fill.buy_order_id]
+            sell_order = orders[fill.sell_order_id]
+            buy_order.filled_qty += fill.quantity
+            sell_order.filled_qty += fill.quantity
+            self.bids.reduce(buy_order, fill.quantity)
+            self.asks.reduce(sell_order, fill.quantity)
+            if buy_order.remaining <= 0:
+                self.bids.remove(buy_order)
+            if sell_order.remaining <= 0:
+                self.asks.remove(sell_order)
+        if fills:
+            self.version += 1
+
+def match_crossing(slices):
+    """Match the crossing part of several books, e.g. inside a worker process.
+
+    Each slice is (symbol, bids, asks) where the sides hold
+    (order_id, price, remaining) tuples in priority order. Returns
+    (symbol, fills) pairs for the caller to apply to its own books, with
+    fills as plain tuples since they pickle much faster than Fill.
+    """
+    results = []
+    for symbol, bids, asks in slices:
+        book = SymbolBook(symbol)
+        for side, orders in (('buy', bids), ('sell', asks)):
+            for order_id, price, remaining in orders:
+                book.add(Order(order_id, None, side, symbol, price, remaining))
+        results.append((symbol, [tuple(fill) for fill in book.match()]))
+    return results
+
+class MatchingEngine:
+    """Resident per-symbol order books with an order_id index."""
+
+    def __init__(self):
+        self.books = {}
+        self.orders = {}
+        self.last_order_id = 0
+        self.last_trade_id = 0
+        self.level_listener = None
+        self._pending = set()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['level_listener'] = None
+        return state
+
+    def book(self, symbol):
+        book = self.books.get(symbol)
+        if book is None:
+            book = self.books[symbol] = SymbolBook(symbol)
+            book.bids.listener = book.asks.listener = self.level_listener
+        return book
+
+    def set_level_listener(self, listener):
+        """Call listener(symbol, side, price, total) on every level change."""
+        self.level_listener = listener
+        for book in self.books.values():
+            book.bids.listener = book.asks.listener = listener
+
+    def next_order_id(self):
+        """Allocate the next order_id so orders can be persisted later."""
+        self.last_order_id += 1
+        return self.last_order_id
+
+    def add_order(self, order):
+        """Rest an order on its book without matching it."""
+        self.book(order.symbol).add(order)
+        self.orders[order.order_id] = order
+        self._pending.add(order.symbol)
+
+    def submit(self, order, kind='limit'):
+        """Match an incoming order on arrival and rest any limit order remainder.
+
+        Only the opposite side of the order's own symbol is touched, so the
+        cost is bounded by the fills this order generates. For the other
+        kinds (see ORDER_KINDS) order.remaining afterwards is the quantity
+        that was not filled and is cancelled; a fill-or-kill order that
+        cannot be filled completely generates no fills at all.
+        """
+        book = self.book(order.symbol)
+        if kind == 'fok' and not book.can_fill(order):
+            return []
+        fills = self._settle(book.match_order(order, rest=kind == 'limit', market=kind == 'market'))
+        if kind == 'limit' and order.remaining > 0:
+            self.orders[order.order_id] = order
+        return fills
+
+    def match(self, symbols=None, executor=None, shards=None):
+        """Match every book that received orders since the last sweep.
+
+        Only books that may have become crossed are visited, so the cost
+        of a sweep depends on the new orders rather than the book size.
+
+        With an executor (e.g. a ProcessPoolExecutor) only the crossing
+        levels of each book are sent out, split into `shards` groups that
+        are matched in parallel, and the returned fills are applied here.
+        Results are merged in symbol order, so fills and trade ids are the
+        same as in a serial sweep.
+        """
+        if symbols is None:
+            symbols = self._pending
+        symbols = sorted(symbols)
+        self._pending.difference_update(symbols)
+        books = [self.books[symbol] for symbol in symbols
+                 if symbol in self.books and self.books[symbol].crossed()]
+
+        fills = []
+        if executor is None or len(books) < 2:
+            for book in books:
+                fills.extend(self._settle(book.match()))
+            return fills
+
+        slices = [(book.symbol,) + book.crossing_slice() for book in books]
+        n = min(shards or len(slices), len(slices))
+        results = []
+        for shard in executor.map(match_crossing, [slices[i::n] for i in range(n)]):
+            results.extend(shard)
+        results.sort(key=lambda result: result[0])
+        for symbol, book_fills in results:
+            book_fills = [Fill._make(fill) for fill in book_fills]
+            self.books[symbol].apply_fills(book_fills, self.orders)
+            fills.extend(self._settle(book_fills))
+        return fills
+
+    def _settle(self, fills):
+        """Assign trade ids and drop fully filled orders from the index."""
+        settled = []
+        for fill in fills:
+            self.last_trade_id += 1
+            settled.append(fill._replace(trade_id=self.last_trade_id))
+            for order_id in (fill.buy_order_id, fill.sell_order_id):
+                order = self.orders.get(order_id)
+                if order is not None and order.remaining <= 0:
+                    del self.orders[order_id]
+        return settled
+
+    def cancel(self, order_id):
+        """Remove a live order from the book and return it, or None if it is not live.
+
+        A partially filled order loses only its remaining quantity; its
+        fills stand.
+        """
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        self.book(order.symbol).remove(order)
+        return order
+
+    def amend(self, order_id, price=None, quantity=None, timestamp=None, match=True):
+        """Change a live order's price and/or lower its quantity.
+
+        quantity is the new total including what has already filled; it
+        may only go down and must stay above the filled quantity. A size
+        reduction keeps the order's place in its queue. A price change
+        sends the order to the back of the queue at the new price (with a
+        new timestamp, if given); with match it is first matched like a new
+        order, otherwise it waits for the next sweep.
+
+        Returns the fills the amend caused, or None if the order is not live.
+        """
+        order = self.orders.get(order_id)
+        if order is None:
+            return None
+        if quantity is not None and not order.filled_qty < quantity <= order.quantity:
+            raise ValueError(f"New quantity of order {order_id} must be above its filled "
+                             f"{from_lots(order.filled_qty)} and at most {from_lots(order.quantity)}")
+        book = self.book(order.symbol)
+        if price is None or price == order.price:
+            if quantity is not None and quantity != order.quantity:
+                book.resize(order, quantity)
+            return []
+        book.remove(order)
+        del self.orders[order_id]
+        order.price = price
+        if quantity is not None:
+            order.quantity = quantity
+        if timestamp is not None:
+            order.timestamp = timestamp
+        if match:
+            return self.submit(order)
+        self.add_order(order)
+        return []
+
+    def depth(self, symbol, levels=None):
+        book = self.books.get(symbol)
+        if book is None:
+            return [], []
+        return book.depth(levels)
+
+    def best_bid_ask(self, symbol):
+        book = self.books.get(symbol)
+        if book is None:
+            return None, None
+        return book.best_bid_ask()
+
+    def version(self, symbol):
+        book = self.books.get(symbol)
+        return book.version if book is not None else 0
@@ -0,0 +1,169 @@
+# metrics.py
+"""Counters, per-stage latency histograms and rate-limited logging.
+
+Instrumented code checks Metrics.enabled before reading the clock, so
+while metrics are off a hot-path call pays for one attribute test:
+
+    start = clock() if metrics.enabled else 0
+    ...
+    if start:
+        metrics.observe('match', clock() - start)
+
+Latencies are recorded in nanoseconds into power-of-two buckets. A
+recording is then a bit_length() and a list increment, and memory per
+stage is fixed however many calls are observed.
+"""
+
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+clock = time.perf_counter_ns
+
+class Histogram:
+    """Latency distribution over power-of-two nanosecond buckets."""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        # Bucket i holds values in [2**(i-1), 2**i)
+        self.buckets = [0] * 65
+
+    def observe(self, ns):
+        self.count += 1
+        self.total += ns
+        if ns > self.max:
+            self.max = ns
+        self.buckets[ns.bit_length()] += 1
+
+    def percentile(self, q):
+        """Estimate the q-quantile (0 < q <= 1) in ns, interpolating within its bucket."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            if n and seen + n >= rank:
+                low = 1 << (i - 1) if i else 0
+                high = min(1 << i, self.max)
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def summary(self):
+        """Return count and latencies in microseconds."""
+        return {
+            'count': self.count,
+            'mean_us': round(self.total / self.count / 1000, 3) if self.count else 0,
+            'p50_us': round(self.percentile(0.5) / 1000, 3),
+            'p99_us': round(self.percentile(0.99) / 1000, 3),
+            'max_us': round(self.max / 1000, 3),
+            'total_ms': round(self.total / 1e6, 3),
+        }
+
+class Metrics:
+    """Named counters and per-stage latency histograms.
+
+    Updates are not locked: the engine is driven from one thread at a
+    time, and an occasional lost increment from another thread is
+    acceptable for monitoring.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.stages = {}
+        self.since = time.time()
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, stage, ns):
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram()
+        histogram.observe(ns)
+
+    def export(self):
+        """Return a JSON-serialisable snapshot of every counter and stage."""
+        return {
+            'enabled': self.enabled,
+            'since': self.since,
+            'elapsed_s': round(time.time() - self.since, 3),
+            'counters': dict(sorted(self.counters.items())),
+            'stages': {stage: histogram.summary() for stage, histogram in sorted(self.stages.items())},
+        }
+
+    def dump(self, path=None):
+        """Write export() as JSON to path, or to stderr if no path is given."""
+        text = json.dumps(self.export(), indent=2)
+        if path is None:
+            print(text, file=sys.stderr)
+        else:
+            with open(path, 'w') as f:
+                f.write(text + '\n')
+
+    def dump_on_signal(self, path=None, signum=getattr(signal, 'SIGUSR1', None)):
+        """Dump the metrics whenever the process receives signum (SIGUSR1 by default).
+
+        Must be called from the main thread; does nothing on platforms
+        without the signal.
+        """
+        if signum is not None:
+            signal.signal(signum, lambda *_: self.dump(path))
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `rate` records per `per` seconds through for each message template.
+
+    Records are grouped by logger, level and unformatted message, so a
+    flood of per-order messages is throttled without hiding unrelated
+    ones. The first record after a quiet period reports how many similar
+    records were dropped.
+    """
+
+    def __init__(self, rate=10, per=1.0):
+        super().__init__()
+        self.rate = rate
+        self.per = per
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            start, passed, dropped = self._windows.get(key, (now, 0, 0))
+            if now - start >= self.per:
+                start, passed = now, 0
+            if passed >= self.rate:
+                self._windows[key] = (start, passed, dropped + 1)
+                return False
+            self._windows[key] = (start, passed + 1, 0)
+        if dropped:
+            record.msg = f"{record.msg} ({dropped} similar messages suppressed)"
+        return True
+
+def configure_logging(level=None, rate=10, per=1.0):
+    """Send log records to stderr, throttled by RateLimitFilter.
+
+    level defaults to the ORDER_BOOK_LOG_LEVEL environment variable, or
+    INFO if it is not set.
+    """
+    level = level or os.environ.get('ORDER_BOOK_LOG_LEVEL', 'INFO').upper()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    handler.addFilter(RateLimitFilter(rate, per))
+    root = logging.getLogger()
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
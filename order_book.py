@@ -1,170 +1,514 @@
 # order_book.py
 
-import sqlite3
+import itertools
+import logging
+import math
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-import yfinance as yf
+from bars import BarAggregator
+from connection_manager import ConnectionManager
+from db_setup import migrate
+from events import EventBus, ORDER_ACCEPTED, FILL, CANCEL, AMEND, LEVEL_CHANGE
+from journal import Journal, JournalError, MAX_TEXT_BYTES, MAX_UNITS, has_state, recover
+from market_data import MarketDataService
+from matching_engine import MatchingEngine, Order, ORDER_KINDS, to_ticks, from_ticks, to_lots, from_lots
+from metrics import Metrics, clock
+from persistence import BatchWriter
 
-def connect_db():
-    """Connect to the SQLite database."""
-    return sqlite3.connect('order_book.db')
-
-def place_order(order_type, symbol, price, quantity):
-    """Place a new buy or sell order."""
-    conn = connect_db()
-    cursor = conn.cursor()
-    timestamp = datetime.utcnow().isoformat()
+logger = logging.getLogger(__name__)
 
-    cursor.execute("""
-        INSERT INTO orders (timestamp, type, symbol, price, quantity, status, filled_qty)
-        VALUES (?, ?, ?, ?, ?, 'open', 0)
-    """, (timestamp, order_type, symbol, price, quantity))
-    order_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    print(f"Order {order_id} placed: {order_type.upper()} {quantity} {symbol} @ {price}")
-    return order_id
+_connections = ConnectionManager('order_book.db')
 
-def match_orders():
-    """Match open buy and sell orders based on price-time priority."""
+def connect_db():
+    """Return this thread's persistent connection to the SQLite database."""
+    return _connections.get()
+
+_engine = None
+_writer = None
+
+def get_engine():
+    """Return the resident matching engine, loading it from SQLite on first use."""
+    global _engine
+    if _engine is None:
+        _engine = load_engine()
+        _engine.set_level_listener(_publish_level_change)
+    return _engine
+
+def get_writer():
+    """Return the batching writer that persists engine activity."""
+    global _writer
+    if _writer is None:
+        _writer = BatchWriter(connect_db, metrics=_metrics, bars=_bars)
+    return _writer
+
+def configure_persistence(batch_size=1000, flush_interval=0.5, durability='commit'):
+    """Replace the writer, flushing anything the current one still holds.
+
+    durability='commit' writes every order and fill before the call that
+    produced it returns; 'group' batches writes by size and age.
+    """
+    global _writer
+    if _writer is not None:
+        _writer.flush()
+    _writer = BatchWriter(connect_db, batch_size=batch_size, flush_interval=flush_interval,
+                          durability=durability, metrics=_metrics, bars=_bars)
+    return _writer
+
+def flush():
+    """Write any buffered orders, trades and status changes to the database."""
+    if _writer is not None:
+        _writer.flush()
+
+def set_database(db_file):
+    """Switch to another SQLite file, e.g. a scratch database for benchmarks.
+
+    Buffered writes go to the current database first. The resident engine
+    is dropped and reloaded from the new file on next use, and any journal
+    is closed. The file must already have the tables (db_setup.create_tables).
+    """
+    global _connections, _engine, _writer, _journal
+    flush()
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+    _connections.close_all()
+    _connections = ConnectionManager(db_file)
+    _engine = None
+    _writer = None
+
+_metrics = Metrics()
+_bars = BarAggregator()
+
+def configure_bars(intervals):
+    """Maintain OHLCV bars at these intervals (in seconds) from now on."""
+    global _bars
+    flush()
+    _bars = BarAggregator(intervals)
+    if _writer is not None:
+        _writer.bars = _bars
+
+def get_metrics():
+    """Return the counters and stage latency histograms; see metrics.Metrics."""
+    return _metrics
+
+def enable_metrics(enabled=True):
+    """Start or stop recording order_entry, match, persist, cancel and book_query latencies."""
+    _metrics.enabled = bool(enabled)
+    return _metrics
+
+_journal = None
+
+def enable_journal(directory, snapshot_interval=100000, sync=False):
+    """Recover the engine from a journal directory and journal all activity from now on.
+
+    If the directory already holds a snapshot, the engine is restored from
+    it plus the journal tail. Whatever the tail holds that the database
+    lacks, e.g. after a crash under 'group' durability, is written back
+    first. Otherwise the engine is loaded from SQLite and snapshotted, so
+    the directory is self-contained from then on.
+
+    Raises JournalError if the database holds orders or trades newer than
+    the journal, e.g. ones entered while the journal was not enabled.
+    Recovering would then reuse their ids; remove the directory to start
+    a fresh journal from the database instead.
+    """
+    global _engine, _journal
+    flush()
+    if _journal is not None:
+        _journal.close()
+        _journal = None
+    recovering = has_state(directory)
+    if recovering:
+        writer = get_writer()
+        last_order_id, last_trade_id = _last_ids(connect_db().cursor())
+        engine = recover(directory, writer=writer, persisted=(last_order_id, last_trade_id))
+        if last_order_id > engine.last_order_id or last_trade_id > engine.last_trade_id:
+            writer.discard()
+            raise JournalError(f"Database is ahead of the journal in {directory} (order {last_order_id}, "
+                               f"trade {last_trade_id} vs order {engine.last_order_id}, "
+                               f"trade {engine.last_trade_id})")
+        writer.flush()
+    else:
+        engine = load_engine()
+    engine.set_level_listener(_publish_level_change)
+    _journal = Journal(directory, snapshot_interval=snapshot_interval, sync=sync)
+    if not recovering:
+        _journal.snapshot(engine)
+    _engine = engine
+    return _journal
+
+def _commit():
+    """End a logical operation: flush the journal, then persist per the writer's durability.
+
+    The journal goes first, so the database never holds anything the
+    journal could not replay.
+    """
+    if _journal is not None:
+        _journal.flush()
+    get_writer().commit()
+    if _journal is not None:
+        _maybe_snapshot(_engine)
+
+def _maybe_snapshot(engine):
+    if _journal.snapshot_due:
+        # Recovery writes back only the journal tail, so everything the
+        # snapshot covers must be in the database first
+        get_writer().flush()
+        _journal.snapshot(engine)
+
+_events = EventBus()
+
+def get_event_bus():
+    """Return the bus that order_accepted, fill, cancel and level_change events are published on."""
+    return _events
+
+def subscribe(callback=None, kinds=None, maxsize=10000, policy='block'):
+    """Subscribe to order book events; see events.EventBus.subscribe."""
+    return _events.subscribe(callback, kinds, maxsize, policy)
+
+def _publish_level_change(symbol, side, price, total):
+    if _events.active:
+        _events.publish(LEVEL_CHANGE, {'symbol': symbol, 'side': side,
+                                       'price': from_ticks(price), 'quantity': from_lots(total)})
+
+def _publish_order(order, kind='limit'):
+    _events.publish(ORDER_ACCEPTED, {'order_id': order.order_id, 'timestamp': order.timestamp,
+                                     'type': order.side, 'symbol': order.symbol, 'kind': kind,
+                                     'price': from_ticks(order.price), 'quantity': from_lots(order.quantity)})
+
+def _publish_cancel(order):
+    _events.publish(CANCEL, {'order_id': order.order_id, 'symbol': order.symbol, 'type': order.side,
+                             'price': from_ticks(order.price), 'quantity': from_lots(order.remaining)})
+
+def load_engine():
+    """Build a matching engine from the open and partially filled orders in the database."""
+    engine = MatchingEngine()
     conn = connect_db()
+    migrate(conn)
     cursor = conn.cursor()
-
-    # Get list of unique symbols with open orders
     cursor.execute("""
-        SELECT DISTINCT symbol FROM orders WHERE status='open'
+        SELECT order_id, timestamp, type, symbol, price, quantity, filled_qty
+        FROM orders WHERE status IN ('open', 'partial')
+        ORDER BY timestamp ASC, order_id ASC
     """)
-    symbols = [row[0] for row in cursor.fetchall()]
-
-    for symbol in symbols:
-        # Fetch open buy orders for the symbol (highest price first)
-        cursor.execute("""
-            SELECT * FROM orders
-            WHERE type='buy' AND status='open' AND symbol=?
-            ORDER BY price DESC, timestamp ASC
-        """, (symbol,))
-        buy_orders = cursor.fetchall()
-
-        # Fetch open sell orders for the symbol (lowest price first)
-        cursor.execute("""
-            SELECT * FROM orders
-            WHERE type='sell' AND status='open' AND symbol=?
-            ORDER BY price ASC, timestamp ASC
-        """, (symbol,))
-        sell_orders = cursor.fetchall()
-
-        # Match orders
-        buy_index = 0
-        sell_index = 0
-        while buy_index < len(buy_orders) and sell_index < len(sell_orders):
-            buy_order = buy_orders[buy_index]
-            sell_order = sell_orders[sell_index]
-
-            if buy_order[4] >= sell_order[4]:  # buy_price >= sell_price
-                execute_trade(buy_order, sell_order, cursor)
-
-                # Update orders after execution
-                cursor.execute("""
-                    SELECT * FROM orders
-                    WHERE order_id = ?
-                """, (buy_order[0],))
-                buy_order = cursor.fetchone()
-                cursor.execute("""
-                    SELECT * FROM orders
-                    WHERE order_id = ?
-                """, (sell_order[0],))
-                sell_order = cursor.fetchone()
-
-                # Update lists if orders are filled
-                if buy_order[6] == 'filled':
-                    buy_index += 1
-                if sell_order[6] == 'filled':
-                    sell_index += 1
-            else:
-                break  # Prices do not overlap, no further matches possible
-
-    conn.commit()
-    conn.close()
-
-def execute_trade(buy_order, sell_order, cursor):
-    """Execute a trade between a buy order and a sell order."""
-    buy_order_id = buy_order[0]
-    sell_order_id = sell_order[0]
-    symbol = buy_order[3]
-    timestamp = datetime.utcnow().isoformat()
-
-    # Determine trade quantity
-    remaining_buy_qty = buy_order[5] - buy_order[7]
-    remaining_sell_qty = sell_order[5] - sell_order[7]
-    trade_qty = min(remaining_buy_qty, remaining_sell_qty)
-
-    # Trade price is the price of the sell order (price-time priority)
-    trade_price = sell_order[4]
-
-    # Insert trade record
-    cursor.execute("""
-        INSERT INTO trades (timestamp, buy_order_id, sell_order_id, symbol, price, quantity)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (timestamp, buy_order_id, sell_order_id, symbol, trade_price, trade_qty))
-
-    # Update filled quantities
-    cursor.execute("""
-        UPDATE orders SET filled_qty = filled_qty + ? WHERE order_id = ?
-    """, (trade_qty, buy_order_id))
-    cursor.execute("""
-        UPDATE orders SET filled_qty = filled_qty + ? WHERE order_id = ?
-    """, (trade_qty, sell_order_id))
-
-    # Update order statuses
-    update_order_status(buy_order_id, cursor)
-    update_order_status(sell_order_id, cursor)
-
-    print(f"Executed trade: BUY order {buy_order_id} and SELL order {sell_order_id}, "
-          f"Symbol: {symbol}, Quantity: {trade_qty}, Price: {trade_price}")
-
-def update_order_status(order_id, cursor):
-    """Update the status of an order based on its filled quantity."""
-    cursor.execute("""
-        SELECT quantity, filled_qty FROM orders WHERE order_id = ?
-    """, (order_id,))
-    quantity, filled_qty = cursor.fetchone()
-    if filled_qty == 0:
-        status = 'open'
-    elif filled_qty < quantity:
-        status = 'partial'
-    elif filled_qty >= quantity:
-        status = 'filled'
+    for order_id, timestamp, side, symbol, price, quantity, filled_qty in cursor.fetchall():
+        engine.add_order(Order(order_id, timestamp, side, symbol, to_ticks(price),
+                               to_lots(quantity), to_lots(filled_qty)))
+    engine.last_order_id, engine.last_trade_id = _last_ids(cursor)
+    return engine
+
+def _last_ids(cursor):
+    """Return the highest order_id and trade_id in the database."""
+    cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders")
+    last_order_id = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(MAX(trade_id), 0) FROM trades")
+    return last_order_id, cursor.fetchone()[0]
+
+# When enabled, place_order matches each new order on arrival instead of
+# leaving it for the next match_orders() sweep.
+continuous_matching = False
+
+def set_continuous_matching(enabled):
+    """Switch between matching on order entry and batch sweeps."""
+    global continuous_matching
+    continuous_matching = bool(enabled)
+
+def _new_order(order_type, symbol, price, quantity, kind='limit'):
+    try:
+        validate_order(order_type, symbol, price, quantity, kind)
+    except ValueError:
+        if _metrics.enabled:
+            _metrics.count('orders_rejected')
+        raise
+    if kind == 'market':
+        price = 0
+    engine = get_engine()
+    order = Order(engine.next_order_id(), datetime.utcnow().isoformat(),
+                  order_type, symbol, to_ticks(price), to_lots(quantity))
+    get_writer().add_order(order, kind)
+    if _events.active:
+        _publish_order(order, kind)
+    logger.info("Order %s placed: %s %s %s %s @ %s", order.order_id, kind.upper(), order_type.upper(),
+                quantity, symbol, price)
+    return engine, order
+
+def place_order(order_type, symbol, price, quantity, kind='limit'):
+    """Place a new buy or sell order.
+
+    kind is one of matching_engine.ORDER_KINDS. Market, IOC and FOK orders
+    are always matched on entry and never rest on the book.
+    """
+    if continuous_matching or kind != 'limit':
+        order_id, _ = submit_order(order_type, symbol, price, quantity, kind)
+        return order_id
+
+    start = clock() if _metrics.enabled else 0
+    engine, order = _new_order(order_type, symbol, price, quantity)
+    engine.add_order(order)
+    if _journal is not None:
+        _journal.record_order(order, False)
+    _commit()
+    if start:
+        _metrics.observe('order_entry', clock() - start)
+        _metrics.count('orders')
+    return order.order_id
+
+def submit_order(order_type, symbol, price, quantity, kind='limit'):
+    """Place an order and immediately match it against its own symbol.
+
+    For market, IOC and FOK orders any quantity left unfilled is
+    cancelled in the same step. Returns the new order_id and the list of
+    fills it generated.
+    """
+    start = clock() if _metrics.enabled else 0
+    engine, order = _new_order(order_type, symbol, price, quantity, kind)
+    if start:
+        matched = clock()
+        fills = engine.submit(order, kind)
+        _metrics.observe('match', clock() - matched)
     else:
-        status = 'error'
+        fills = engine.submit(order, kind)
+    if _journal is not None:
+        _journal.record_order(order, True, kind)
+    fills = record_fills(fills)
+    unfilled = kind != 'limit' and order.remaining > 0
+    if unfilled:
+        get_writer().cancel(order.order_id, order.timestamp)
+    _commit()
+    if unfilled:
+        _publish_cancel(order)
+        logger.info("Order %s: unfilled %s %s cancelled.", order.order_id, kind.upper(),
+                    from_lots(order.remaining))
+    if start:
+        _metrics.observe('order_entry', clock() - start)
+        _metrics.count('orders')
+    return order.order_id, fills
+
+def validate_order(order_type, symbol, price, quantity, kind='limit'):
+    """Raise ValueError if the fields do not describe a valid order.
+
+    Prices and quantities must be finite and at least one tick or lot
+    once rounded (see matching_engine.to_ticks and to_lots). Market
+    orders need no price; any price given is ignored.
+    """
+    if order_type not in ('buy', 'sell'):
+        raise ValueError(f"Invalid order type: {order_type!r}")
+    if kind not in ORDER_KINDS:
+        raise ValueError(f"Invalid order kind: {kind!r}")
+    if not symbol:
+        raise ValueError("Missing symbol")
+    if len(symbol.encode()) > MAX_TEXT_BYTES:
+        raise ValueError(f"Symbol longer than {MAX_TEXT_BYTES} bytes")
+    if kind != 'market':
+        _check_price(price)
+    _check_quantity(quantity)
+
+def _check_price(price):
+    # The engine works in whole ticks and the journal stores them in 64 bits
+    if not (math.isfinite(price) and 0 < to_ticks(price) <= MAX_UNITS):
+        raise ValueError(f"Invalid price: {price!r}")
+
+def _check_quantity(quantity):
+    if not (math.isfinite(quantity) and 0 < to_lots(quantity) <= MAX_UNITS):
+        raise ValueError(f"Invalid quantity: {quantity!r}")
+
+def place_orders(orders, match=False, chunk_size=10000):
+    """Place many (order_type, symbol, price, quantity) orders at once.
+
+    The iterable is consumed in chunks of chunk_size, so memory stays
+    bounded for arbitrarily long order streams. Each chunk is validated,
+    handed to the engine (matched on entry if match is True) and written
+    in a single transaction. Returns (orders placed, fills generated).
+    """
+    engine = get_engine()
+    writer = get_writer()
+    orders = iter(orders)
+    placed = 0
+    filled = 0
+    while True:
+        chunk = list(itertools.islice(orders, chunk_size))
+        if not chunk:
+            break
+        timestamp = datetime.utcnow().isoformat()
+        for i, (order_type, symbol, price, quantity) in enumerate(chunk, placed):
+            try:
+                validate_order(order_type, symbol, price, quantity)
+            except ValueError as e:
+                raise ValueError(f"Order {i}: {e}") from None
+        for order_type, symbol, price, quantity in chunk:
+            order = Order(engine.next_order_id(), timestamp, order_type, symbol,
+                          to_ticks(price), to_lots(quantity))
+            writer.add_order(order)
+            if _events.active:
+                _publish_order(order)
+            if match:
+                fills = engine.submit(order)
+                writer.add_fills(fills)
+                filled += len(fills)
+                if _journal is not None:
+                    _journal.record_order(order, True)
+                    _journal.record_fills(fills)
+                if _events.active:
+                    for fill in fills:
+                        _events.publish(FILL, _public_fill(fill))
+            else:
+                engine.add_order(order)
+                if _journal is not None:
+                    _journal.record_order(order, False)
+        if _journal is not None:
+            _journal.flush()
+        writer.flush()
+        if _journal is not None:
+            _maybe_snapshot(engine)
+        placed += len(chunk)
+        if _metrics.enabled:
+            _metrics.count('orders', len(chunk))
+    if _metrics.enabled:
+        _metrics.count('fills', filled)
+    logger.info("%s orders placed, %s fills.", placed, filled)
+    return placed, filled
+
+_match_pool = None
+_match_pool_workers = 0
+
+def _get_match_pool(workers):
+    global _match_pool, _match_pool_workers
+    if _match_pool is None or _match_pool_workers != workers:
+        if _match_pool is not None:
+            _match_pool.shutdown()
+        _match_pool = ProcessPoolExecutor(max_workers=workers)
+        _match_pool_workers = workers
+    return _match_pool
+
+def match_orders(workers=None):
+    """Match crossing buy and sell orders based on price-time priority.
+
+    With workers > 1, crossed symbols are partitioned across a pool of
+    worker processes. Symbols are independent, so the fills and trade ids
+    are identical to a serial sweep.
+    """
+    executor = _get_match_pool(workers) if workers and workers > 1 else None
+    start = clock() if _metrics.enabled else 0
+    fills = get_engine().match(executor=executor, shards=workers)
+    if start:
+        _metrics.observe('match', clock() - start)
+        _metrics.count('match_sweeps')
+    if _journal is not None:
+        _journal.record_match()
+    fills = record_fills(fills)
+    _commit()
+    return fills
+
+def record_fills(fills):
+    """Queue fills produced by the matching engine for persistence.
+
+    Returns the fills with prices and quantities converted back from
+    engine ticks and lots.
+    """
+    get_writer().add_fills(fills)
+    if _journal is not None:
+        _journal.record_fills(fills)
+    if _metrics.enabled:
+        _metrics.count('fills', len(fills))
+    trades = []
+    for fill in fills:
+        trade = _public_fill(fill)
+        _events.publish(FILL, trade)
+        logger.info("Executed trade: BUY order %s and SELL order %s, Symbol: %s, Quantity: %s, Price: %s",
+                    trade.buy_order_id, trade.sell_order_id, trade.symbol, trade.quantity, trade.price)
+        trades.append(trade)
+    return trades
 
-    cursor.execute("""
-        UPDATE orders SET status = ? WHERE order_id = ?
-    """, (status, order_id))
+def _public_fill(fill):
+    return fill._replace(price=from_ticks(fill.price), quantity=from_lots(fill.quantity),
+                         buy_remaining=from_lots(fill.buy_remaining),
+                         sell_remaining=from_lots(fill.sell_remaining))
 
 def cancel_order(order_id):
-    """Cancel an open order."""
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("""
-        UPDATE orders SET status='cancelled' WHERE order_id=? AND status='open'
-    """, (order_id,))
-    if cursor.rowcount == 0:
-        print(f"Order {order_id} cannot be cancelled (may already be filled or cancelled).")
-    else:
-        print(f"Order {order_id} has been cancelled.")
-    conn.commit()
-    conn.close()
+    """Cancel an open or partially filled order.
+
+    Only the remaining quantity of a partially filled order is cancelled;
+    its trades stand. The order is found through the engine's order_id
+    index, so the cost does not depend on the size of the book.
+    """
+    start = clock() if _metrics.enabled else 0
+    order = get_engine().cancel(order_id)
+    if order is None:
+        if start:
+            _metrics.count('cancels_rejected')
+        logger.info("Order %s cannot be cancelled (may already be filled or cancelled).", order_id)
+        return False
+    timestamp = datetime.utcnow().isoformat()
+    get_writer().cancel(order_id, timestamp)
+    if _journal is not None:
+        _journal.record_cancel(order_id, timestamp)
+    _commit()
+    _publish_cancel(order)
+    if start:
+        _metrics.observe('cancel', clock() - start)
+        _metrics.count('cancels')
+    logger.info("Order %s has been cancelled.", order_id)
+    return True
+
+def amend_order(order_id, price=None, quantity=None, match=None):
+    """Change the price and/or lower the quantity of a live order.
+
+    quantity is the new total order quantity, including anything already
+    filled. Lowering it keeps the order's time priority; changing the
+    price sends it to the back of the queue at the new price, matching it
+    first if match is set (by default, if continuous matching is on).
+    Raises ValueError for an invalid price or a quantity that is not a
+    reduction.
+
+    Returns the fills caused by the amend, or None if the order is not
+    live (unknown, filled or cancelled).
+    """
+    if price is not None:
+        _check_price(price)
+    if quantity is not None:
+        _check_quantity(quantity)
+    if match is None:
+        match = continuous_matching
+    start = clock() if _metrics.enabled else 0
+    engine = get_engine()
+    # Held here because an amend that fills the order drops it from the index
+    order = engine.orders.get(order_id)
+    if order is None:
+        if start:
+            _metrics.count('amends_rejected')
+        logger.info("Order %s cannot be amended (may already be filled or cancelled).", order_id)
+        return None
+    timestamp = datetime.utcnow().isoformat()
+    fills = engine.amend(order_id, None if price is None else to_ticks(price),
+                         None if quantity is None else to_lots(quantity), timestamp, match=match)
+    get_writer().amend(order, timestamp)
+    if _journal is not None:
+        _journal.record_amend(order, match, timestamp)
+    fills = record_fills(fills)
+    _commit()
+    _events.publish(AMEND, {'order_id': order_id, 'symbol': order.symbol, 'type': order.side,
+                            'price': from_ticks(order.price), 'quantity': from_lots(order.quantity),
+                            'remaining': from_lots(order.remaining)})
+    if start:
+        _metrics.observe('amend', clock() - start)
+        _metrics.count('amends')
+    logger.info("Order %s amended: %s @ %s", order_id, from_lots(order.quantity), from_ticks(order.price))
+    return fills
 
 def get_open_orders():
-    """Retrieve all open orders."""
+    """Retrieve all open and partially filled orders."""
+    start = clock() if _metrics.enabled else 0
+    flush()
     conn = connect_db()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT order_id, timestamp, type, symbol, price, (quantity - filled_qty) AS remaining_qty, status
-        FROM orders WHERE status='open'
+        FROM orders WHERE status IN ('open', 'partial')
         ORDER BY timestamp ASC
     """)
     orders = cursor.fetchall()
-    conn.close()
+    if start:
+        _metrics.observe('book_query', clock() - start)
     return orders
 
 def get_stock_symbols():
@@ -173,73 +517,109 @@ def get_stock_symbols():
     cursor = conn.cursor()
     cursor.execute("SELECT symbol FROM stocks")
     symbols = [row[0] for row in cursor.fetchall()]
-    conn.close()
     return symbols
 
-def get_order_book(symbol):
-    """Retrieve the order book for a specific symbol."""
-    conn = connect_db()
-    cursor = conn.cursor()
-
-    # Sell Orders (Asks)
-    cursor.execute("""
-        SELECT price, SUM(quantity - filled_qty) AS qty
-        FROM orders
-        WHERE type='sell' AND status='open' AND symbol=?
-        GROUP BY price
-        ORDER BY price ASC
-    """, (symbol,))
-    asks = cursor.fetchall()
-
-    # Buy Orders (Bids)
-    cursor.execute("""
-        SELECT price, SUM(quantity - filled_qty) AS qty
-        FROM orders
-        WHERE type='buy' AND status='open' AND symbol=?
-        GROUP BY price
-        ORDER BY price DESC
-    """, (symbol,))
-    bids = cursor.fetchall()
-
-    conn.close()
-    return bids, asks
-
-def get_trades():
-    """Retrieve the trade history."""
+def get_order_book(symbol, depth=None):
+    """Retrieve the order book for a specific symbol.
+
+    Returns (bids, asks) as lists of (price, quantity) levels, best first,
+    limited to the top `depth` levels per side when given.
+    """
+    start = clock() if _metrics.enabled else 0
+    bids, asks = get_engine().depth(symbol, depth)
+    book = ([(from_ticks(price), from_lots(qty)) for price, qty in bids],
+            [(from_ticks(price), from_lots(qty)) for price, qty in asks])
+    if start:
+        _metrics.observe('book_query', clock() - start)
+    return book
+
+def get_best_bid_ask(symbol):
+    """Return the best bid and best ask for a symbol (None for an empty side)."""
+    return tuple(None if price is None else from_ticks(price)
+                 for price in get_engine().best_bid_ask(symbol))
+
+def get_book_version(symbol):
+    """Return a counter that changes whenever the symbol's book changes."""
+    return get_engine().version(symbol)
+
+def get_trades(limit=None, offset=0):
+    """Retrieve the trade history, newest first.
+
+    limit and offset select a page of the history; by default every
+    trade is returned.
+    """
+    start = clock() if _metrics.enabled else 0
+    flush()
     conn = connect_db()
     cursor = conn.cursor()
     cursor.execute("""
         SELECT trade_id, timestamp, symbol, price, quantity
         FROM trades
         ORDER BY timestamp DESC
-    """)
+        LIMIT ? OFFSET ?
+    """, (-1 if limit is None else limit, offset))
     trades = cursor.fetchall()
-    conn.close()
+    if start:
+        _metrics.observe('book_query', clock() - start)
     return trades
 
-def update_stock_prices():
-    """Update current prices of stocks in the database using yfinance."""
+def get_bars(symbol, interval=60, start=None, end=None):
+    """Retrieve OHLCV bars for a symbol, oldest first.
+
+    interval is the bar length in seconds (see configure_bars). start and
+    end (datetimes or ISO timestamps, end exclusive) bound the bucket
+    start times. Rows are (start, open, high, low, close, volume, vwap,
+    trade_count) read from the bars rollup, so the cost depends on the
+    number of bars returned, not the number of trades.
+    """
+    started = clock() if _metrics.enabled else 0
+    flush()
+    conn = connect_db()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT start, open, high, low, close, volume, notional / volume, trade_count
+        FROM bars
+        WHERE symbol = ? AND interval = ? AND start >= ? AND start < ?
+        ORDER BY start ASC
+    """, (symbol, interval,
+          # '' and '~' sort before and after every ISO timestamp
+          '' if start is None else _iso(start), '~' if end is None else _iso(end)))
+    bars = cursor.fetchall()
+    if started:
+        _metrics.observe('book_query', clock() - started)
+    return bars
+
+def _iso(timestamp):
+    return timestamp if isinstance(timestamp, str) else timestamp.isoformat()
+
+_market_data = None
+
+def get_market_data():
+    """Return the shared market data service."""
+    global _market_data
+    if _market_data is None:
+        _market_data = MarketDataService()
+    return _market_data
+
+def set_market_data_provider(provider, ttl=60.0):
+    """Use a different MarketDataProvider, e.g. market_data.FakeProvider offline."""
+    global _market_data
+    _market_data = MarketDataService(provider, ttl=ttl)
+
+def update_stock_prices(force=False):
+    """Update current prices of stocks in the database.
+
+    Prices fetched within the market data TTL are reused unless force is set.
+    """
     conn = connect_db()
     cursor = conn.cursor()
     cursor.execute("SELECT symbol FROM stocks")
     symbols = [row[0] for row in cursor.fetchall()]
-    updated_stocks = []
-
-    for symbol in symbols:
-        try:
-            ticker = yf.Ticker(symbol)
-            data = ticker.history(period='1d')
-            if data.empty:
-                continue
-            current_price = data['Close'][0]
-            updated_stocks.append((current_price, symbol))
-        except Exception as e:
-            print(f"Error updating price for {symbol}: {e}")
+    prices = get_market_data().get_prices(symbols, force=force)
 
     cursor.executemany("""
         UPDATE stocks SET current_price = ? WHERE symbol = ?
-    """, updated_stocks)
+    """, [(price, symbol) for symbol, price in prices.items()])
 
     conn.commit()
-    conn.close()
-    print("Stock prices updated.")
+    logger.info("Stock prices updated.")
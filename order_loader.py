@@ -0,0 +1,56 @@
+# order_loader.py
+
+import argparse
+import csv
+import json
+
+from metrics import configure_logging
+from order_book import enable_metrics, get_metrics, place_orders, validate_order
+
+def _record(fields, source):
+    try:
+        record = (fields['type'].strip().lower(), fields['symbol'].strip().upper(),
+                  float(fields['price']), float(fields['quantity']))
+        validate_order(*record)
+    except (KeyError, AttributeError, TypeError, ValueError) as e:
+        raise ValueError(f"{source}: invalid order {fields!r} ({e})") from None
+    return record
+
+def read_orders(path):
+    """Stream (order_type, symbol, price, quantity) tuples from a CSV or JSONL file.
+
+    CSV files need a header with type, symbol, price and quantity columns.
+    JSONL files hold one object with the same keys per line; blank lines
+    are skipped. Rows are yielded one at a time so files of any size can
+    be replayed.
+    """
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            for line_no, row in enumerate(csv.DictReader(f), 2):
+                yield _record(row, f"{path}:{line_no}")
+        else:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    fields = json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"{path}:{line_no}: {e}") from None
+                yield _record(fields, f"{path}:{line_no}")
+
+def load_orders(path, match=False, chunk_size=10000):
+    """Replay an order file through place_orders(). Returns (orders placed, fills)."""
+    return place_orders(read_orders(path), match=match, chunk_size=chunk_size)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load orders from a CSV or JSONL file.")
+    parser.add_argument('path')
+    parser.add_argument('--match', action='store_true', help='match each order on entry')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--metrics', action='store_true', help='print stage metrics when done')
+    args = parser.parse_args()
+    configure_logging()
+    enable_metrics(args.metrics)
+    load_orders(args.path, match=args.match, chunk_size=args.chunk_size)
+    if args.metrics:
+        get_metrics().dump()
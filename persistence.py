@@ -0,0 +1,166 @@
+# persistence.py
+
+import atexit
+import time
+
+from matching_engine import from_lots, from_ticks
+from metrics import clock
+
+# Durability modes for BatchWriter.commit():
+#   'commit' - every commit() flushes, so a call that returns has been written
+#   'group'  - writes are grouped and flushed by the first commit() that
+#              finds batch_size records buffered or flush_interval seconds
+#              passed since the last flush. Nothing flushes between commits,
+#              so an idle process holds its last writes until the next
+#              operation, an explicit flush() or exit; a crash loses them.
+DURABILITY_MODES = ('commit', 'group')
+
+class PersistenceError(Exception):
+    """Raised when a flush fails.
+
+    The batch being written is discarded rather than retried, so one bad
+    record cannot block every later flush. The database then no longer
+    matches the engine that produced the batch; reload the engine from
+    the database (or recover it from a journal) before trusting either.
+    """
+
+class BatchWriter:
+    """Accumulate order, trade and status writes and flush them in batches.
+
+    Records are buffered in memory and written with executemany inside a
+    single transaction, so one flush costs a handful of statements no
+    matter how many fills it carries.
+    """
+
+    def __init__(self, connect, batch_size=1000, flush_interval=0.5, durability='commit', metrics=None,
+                 bars=None):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        # Optional metrics.Metrics; flushes are recorded as the 'persist' stage
+        self.metrics = metrics
+        # Optional bars.BarAggregator, written in the same transaction as the trades
+        self.bars = bars
+        self._reset()
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def add_order(self, order, kind='limit'):
+        """Queue the insert of a newly accepted order."""
+        self._new_orders.append((order.order_id, order.timestamp, order.side, order.symbol,
+                                 from_ticks(order.price), from_lots(order.quantity), kind))
+        self._pending += 1
+
+    def add_fills(self, fills):
+        """Queue trade records and the latest remaining quantity of each order."""
+        states = self._fill_states
+        for fill in fills:
+            self._trades.append((fill.trade_id, fill.timestamp, fill.buy_order_id, fill.sell_order_id,
+                                 fill.symbol, from_ticks(fill.price), from_lots(fill.quantity)))
+            # Later fills supersede earlier ones, so one UPDATE per order suffices
+            states[fill.buy_order_id] = fill.buy_remaining
+            states[fill.sell_order_id] = fill.sell_remaining
+        if self.bars is not None:
+            self.bars.add_fills(fills)
+        self._pending += len(fills)
+
+    def cancel(self, order_id, timestamp):
+        """Queue a status change to 'cancelled' at timestamp (None if unknown)."""
+        self._cancels.append((timestamp, order_id))
+        self._pending += 1
+
+    def amend(self, order, timestamp):
+        """Queue an order's new price, quantity and timestamp after an amend made at timestamp."""
+        self._amends[order.order_id] = (order.timestamp, from_ticks(order.price),
+                                        from_lots(order.quantity), timestamp, order.order_id)
+        # Amends are written before fill states, so a queued remaining
+        # quantity must be relative to the amended quantity
+        if order.order_id in self._fill_states:
+            self._fill_states[order.order_id] = order.remaining
+        self._pending += 1
+
+    @property
+    def pending(self):
+        """Number of records buffered and not yet written."""
+        return self._pending
+
+    def commit(self):
+        """Mark the end of a logical operation and flush per the durability mode."""
+        if self.durability == 'commit':
+            self.flush()
+        elif (self._pending >= self.batch_size
+              or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Write every buffered record in one transaction.
+
+        Raises PersistenceError, with the buffers cleared, if the write fails.
+        """
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        metrics = self.metrics
+        start = clock() if metrics is not None and metrics.enabled else 0
+        try:
+            self._write(self.connect())
+        except Exception as e:
+            dropped = self._pending
+            self.discard()
+            raise PersistenceError(f"Failed to write {dropped} buffered records; "
+                                   f"they were discarded: {e}") from e
+        if start:
+            metrics.observe('persist', clock() - start)
+            metrics.count('rows_written', self._pending)
+        self._reset()
+
+    def discard(self):
+        """Drop every buffered record, and the bars they would have updated, unwritten."""
+        self._reset()
+        if self.bars is not None:
+            self.bars.discard()
+
+    def _reset(self):
+        self._new_orders = []
+        self._trades = []
+        self._fill_states = {}
+        self._cancels = []
+        self._amends = {}
+        self._pending = 0
+
+    def _write(self, conn):
+        with conn:
+            cursor = conn.cursor()
+            if self._new_orders:
+                cursor.executemany("""
+                    INSERT INTO orders (order_id, timestamp, type, symbol, price, quantity, order_kind,
+                                        status, filled_qty, entered_at)
+                    VALUES (?1, ?2, ?3, ?4, ?5, ?6, ?7, 'open', 0, ?2)
+                """, self._new_orders)
+            if self._trades:
+                cursor.executemany("""
+                    INSERT INTO trades (trade_id, timestamp, buy_order_id, sell_order_id, symbol, price, quantity)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, self._trades)
+                if self.bars is not None:
+                    self.bars.write(cursor)
+            if self._amends:
+                cursor.executemany("""
+                    UPDATE orders SET timestamp = ?, price = ?, quantity = ?, updated_at = ? WHERE order_id = ?
+                """, list(self._amends.values()))
+            if self._fill_states:
+                # Status comes from the engine's integer lots, not a float comparison
+                cursor.executemany("""
+                    UPDATE orders
+                    SET filled_qty = quantity - ?,
+                        status = ?
+                    WHERE order_id = ?
+                """, [(from_lots(remaining), 'filled' if remaining <= 0 else 'partial', order_id)
+                      for order_id, remaining in self._fill_states.items()])
+            if self._cancels:
+                cursor.executemany("""
+                    UPDATE orders SET status='cancelled', updated_at=? WHERE order_id=?
+                """, self._cancels)
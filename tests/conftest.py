@@ -0,0 +1,28 @@
+# tests/conftest.py
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import order_book
+from db_setup import create_tables
+
+@pytest.fixture
+def database(tmp_path):
+    """Point order_book at an empty scratch database and return its path."""
+    path = str(tmp_path / 'order_book.db')
+    conn = sqlite3.connect(path)
+    create_tables(conn)
+    conn.close()
+    order_book.set_database(path)
+    order_book.configure_persistence()
+    order_book.set_continuous_matching(False)
+    yield path
+    order_book.set_continuous_matching(False)
+    # Close the journal and connections before tmp_path is removed
+    order_book.set_database(':memory:')
@@ -0,0 +1,81 @@
+# tests/test_analytics.py
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import analytics
+import order_book
+
+def history(n=300, trades=120, seed=0):
+    rng = np.random.default_rng(seed)
+    base = np.datetime64('2026-01-01T00:00:00', 'us')
+    timestamps = base + np.sort(rng.integers(0, 10**8, n)).astype('timedelta64[us]')
+    orders = {
+        'order_id': np.arange(1, n + 1),
+        'timestamp': timestamps,
+        'type': rng.choice(['buy', 'sell'], n),
+        'symbol': rng.choice(['A', 'B'], n),
+        'price': np.round(rng.normal(100, 2, n), 2),
+        'quantity': np.ones(n),
+        'filled_qty': np.zeros(n),
+        'status': rng.choice(['open', 'partial', 'filled', 'cancelled'], n),
+        'order_kind': rng.choice(['limit', 'ioc'], n, p=[0.9, 0.1]),
+    }
+    buys = rng.integers(1, n + 1, trades)
+    sells = rng.integers(1, n + 1, trades)
+    delay = rng.integers(0, 10**6, trades).astype('timedelta64[us]')
+    trades = {
+        'trade_id': np.arange(1, trades + 1),
+        'timestamp': np.maximum(timestamps[buys - 1], timestamps[sells - 1]) + delay,
+        'buy_order_id': buys,
+        'sell_order_id': sells,
+    }
+    times = base + rng.integers(-10**6, 11 * 10**7, 500).astype('timedelta64[us]')
+    return orders, trades, times
+
+def brute_force_spread(orders, trades, symbol, times):
+    ends = analytics.order_end_times(orders, trades)
+    resting = (orders['symbol'] == symbol) & (orders['order_kind'] == 'limit')
+    bids, asks = [], []
+    for t in times:
+        live = resting & (orders['timestamp'] <= t) & (np.isnat(ends) | (ends > t))
+        buy_prices = orders['price'][live & (orders['type'] == 'buy')]
+        sell_prices = orders['price'][live & (orders['type'] == 'sell')]
+        bids.append(buy_prices.max() if len(buy_prices) else np.nan)
+        asks.append(sell_prices.min() if len(sell_prices) else np.nan)
+    return np.array(bids), np.array(asks)
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_spread_over_time_matches_a_per_sample_rebuild(seed):
+    orders, trades, times = history(seed=seed)
+    bids, asks, spreads = analytics.spread_over_time(orders, trades, 'A', times)
+    expected_bids, expected_asks = brute_force_spread(orders, trades, 'A', times)
+    np.testing.assert_array_equal(bids, expected_bids)
+    np.testing.assert_array_equal(asks, expected_asks)
+    np.testing.assert_array_equal(spreads, expected_asks - expected_bids)
+
+def test_spread_over_time_without_orders():
+    orders, trades, times = history()
+    bids, asks, _ = analytics.spread_over_time(orders, trades, 'missing', times)
+    assert np.isnan(bids).all() and np.isnan(asks).all()
+
+def test_exported_history_keeps_entry_and_cancel_times(database, tmp_path):
+    order_book.place_order('sell', 'X', 10, 1)
+    order_book.place_order('buy', 'X', 9, 1)
+    order_book.amend_order(1, price=11)
+    order_book.cancel_order(2)
+    order_book.flush()
+    directory = str(tmp_path / 'exports')
+    analytics.export(database, directory)
+    orders = analytics.load(directory, 'orders')
+    trades = analytics.load(directory, 'trades')
+    assert len(trades['trade_id']) == 0 and trades['symbol'].dtype.kind == 'U'
+    entered = orders['entered_at']
+    assert entered[0] < orders['timestamp'][0]
+    ends = analytics.order_end_times(orders, trades)
+    assert np.isnat(ends[0]) and ends[1] == orders['updated_at'][1] > entered[1]
+    times = [entered[1], orders['timestamp'][0], ends[1]]
+    bids, asks, _ = analytics.spread_over_time(orders, trades, 'X', times)
+    np.testing.assert_array_equal(bids, [9, 9, np.nan])
+    np.testing.assert_array_equal(asks, [11, 11, 11])
@@ -0,0 +1,80 @@
+# tests/test_gateway.py
+
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+import order_book
+from gateway import ACK, BINARY_MAGIC, NEW_ORDER, REJECT, KIND_ACK, KIND_NEW, KIND_REJECT, OrderGateway
+
+def new_order(client_id, price=10, quantity=1, symbol='X'):
+    return {'op': 'new', 'id': client_id, 'type': 'buy', 'symbol': symbol, 'price': price, 'quantity': quantity}
+
+async def exchange(*rounds):
+    """Send each round of JSON requests on one connection and read that many replies."""
+    gateway = OrderGateway()
+    server = await gateway.serve(port=0)
+    replies = []
+    async with server:
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        for requests, count in rounds:
+            writer.write(b''.join(json.dumps(request).encode() + b'\n' for request in requests))
+            for _ in range(count):
+                replies.append(json.loads(await asyncio.wait_for(reader.readline(), 5)))
+        writer.close()
+    assert not gateway._matcher.done()
+    gateway._matcher.cancel()
+    return replies
+
+def take_order_id(path, order_id):
+    """Insert an order behind the writer's back so its next insert fails."""
+    conn = sqlite3.connect(path)
+    conn.execute("""INSERT INTO orders (order_id, timestamp, type, symbol, price, quantity, status)
+                    VALUES (?, 't', 'buy', 'Q', 1, 1, 'open')""", (order_id,))
+    conn.commit()
+    conn.close()
+
+def test_rejects_echo_the_client_id(database):
+    replies = asyncio.run(exchange(([
+        {'op': 'new', 'id': 5, 'type': 'buy', 'symbol': 'X', 'price': 'x', 'quantity': 1},
+        new_order(6, quantity=0.00001),
+        new_order(7),
+    ], 3)))
+    assert [(reply['op'], reply['id']) for reply in replies] == [('reject', 5), ('reject', 6), ('ack', 7)]
+
+def test_serve_keeps_the_configured_writer(database):
+    writer = order_book.configure_persistence(batch_size=7, durability='group')
+    asyncio.run(exchange(([new_order(1)], 1)))
+    assert order_book.get_writer() is writer
+
+@pytest.mark.parametrize('durability, first_replies', [
+    # The batch flush fails after the order was acked
+    ('group', [('ack', 1), ('error', 1)]),
+    # submit_order()'s own commit fails, so there is no ack to send
+    ('commit', [('error', 1)]),
+])
+def test_failed_writes_are_reported_and_the_gateway_keeps_running(database, durability, first_replies):
+    order_book.configure_persistence(durability=durability, flush_interval=60)
+    order_book.get_engine()
+    take_order_id(database, 1)
+    replies = asyncio.run(exchange(([new_order(1)], len(first_replies)), ([new_order(2)], 1)))
+    assert [(reply['op'], reply['id']) for reply in replies] == first_replies + [('ack', 2)]
+
+def test_binary_symbols_that_are_not_utf8_are_rejected(database):
+    async def run():
+        gateway = OrderGateway()
+        server = await gateway.serve(port=0)
+        async with server:
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(BINARY_MAGIC + NEW_ORDER.pack(KIND_NEW, 0, 1, b'\xff\xfe', 10, 1)
+                         + NEW_ORDER.pack(KIND_NEW, 0, 2, b'X', 10, 1))
+            replies = (REJECT.unpack(await asyncio.wait_for(reader.readexactly(REJECT.size), 5)),
+                       ACK.unpack(await asyncio.wait_for(reader.readexactly(ACK.size), 5)))
+            writer.close()
+        gateway._matcher.cancel()
+        return replies
+    assert asyncio.run(run()) == ((KIND_REJECT, 1), (KIND_ACK, 2, 1))
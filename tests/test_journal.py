@@ -0,0 +1,117 @@
+# tests/test_journal.py
+
+import sqlite3
+
+import pytest
+
+import order_book
+from journal import JournalError, recover
+
+def book_state(engine):
+    return ({symbol: engine.depth(symbol) for symbol in engine.books},
+            {order_id: (o.price, o.quantity, o.filled_qty, o.timestamp) for order_id, o in engine.orders.items()},
+            engine.last_order_id, engine.last_trade_id)
+
+def run_session():
+    order_book.place_order('sell', 'X', 10, 5)
+    order_book.place_order('sell', 'X', 10.5, 5)
+    order_book.place_order('buy', 'X', 9, 5)
+    order_book.submit_order('buy', 'X', 10.5, 7)
+    order_book.amend_order(3, price=9.5, quantity=4)
+    order_book.amend_order(2, quantity=2.5)
+    order_book.cancel_order(2)
+    order_book.submit_order('sell', 'X', 9, 1, 'fok')
+    order_book.place_order('sell', 'Y', 20, 1)
+    order_book.place_order('buy', 'Y', 21, 2)
+    order_book.match_orders()
+    order_book.place_orders([('buy', 'Z', 1, 1), ('sell', 'Z', 1, 1)], match=True)
+
+@pytest.mark.parametrize('snapshot_interval', [100000, 3])
+def test_recover_reproduces_the_engine(database, tmp_path, snapshot_interval):
+    directory = str(tmp_path / 'journal')
+    order_book.enable_journal(directory, snapshot_interval=snapshot_interval)
+    run_session()
+    order_book.flush()
+    expected = book_state(order_book.get_engine())
+    assert book_state(recover(directory)) == expected
+    # Recovery through order_book resumes journaling on top of the tail
+    order_book.set_database(database)
+    order_book.enable_journal(directory)
+    assert book_state(order_book.get_engine()) == expected
+    order_book.place_order('buy', 'X', 9, 1)
+    order_book.flush()
+    assert book_state(recover(directory)) == book_state(order_book.get_engine())
+
+def test_long_symbols_are_journaled(database, tmp_path):
+    directory = str(tmp_path / 'journal')
+    order_book.enable_journal(directory)
+    symbol = 'S' * 300
+    order_book.place_order('sell', symbol, 10, 5)
+    order_book.submit_order('buy', symbol, 10, 2)
+    order_book.flush()
+    assert book_state(recover(directory)) == book_state(order_book.get_engine())
+    with pytest.raises(ValueError):
+        order_book.place_order('buy', 'S' * 70000, 10, 1)
+
+def test_refuses_to_recover_behind_the_database(database, tmp_path):
+    directory = str(tmp_path / 'journal')
+    order_book.enable_journal(directory)
+    order_book.place_order('buy', 'X', 1, 1)
+    order_book.set_database(database)
+    # Written while the journal was not enabled
+    order_book.place_order('buy', 'X', 1, 1)
+    order_book.set_database(database)
+    with pytest.raises(JournalError):
+        order_book.enable_journal(directory)
+    assert order_book.place_order('buy', 'X', 1, 1) == 3
+
+def test_recovery_writes_back_what_the_database_lost(database, tmp_path):
+    directory = str(tmp_path / 'journal')
+    order_book.configure_persistence(durability='group', batch_size=1000, flush_interval=60)
+    order_book.enable_journal(directory)
+    order_book.place_order('sell', 'X', 10, 1)
+    order_book.flush()
+    order_book.place_order('sell', 'X', 11, 1)
+    order_book.submit_order('buy', 'X', 10.5, 2, 'ioc')
+    order_book.amend_order(2, quantity=0.5)
+    # A crash before the group flush loses the writer's buffers
+    order_book.get_writer().discard()
+    order_book.set_database(database)
+    order_book.enable_journal(directory)
+    order_book.submit_order('buy', 'X', 11, 1)
+    order_book.flush()
+    conn = sqlite3.connect(database)
+    try:
+        orders = conn.execute("SELECT order_id, status, quantity, filled_qty FROM orders").fetchall()
+        trades = conn.execute("SELECT trade_id, buy_order_id, sell_order_id FROM trades").fetchall()
+    finally:
+        conn.close()
+    assert orders == [(1, 'filled', 1.0, 1.0), (2, 'filled', 0.5, 0.5), (3, 'cancelled', 2.0, 1.0),
+                      (4, 'partial', 1.0, 0.5)]
+    assert trades == [(1, 3, 1), (2, 4, 2)]
+    assert [row[0] for row in order_book.get_open_orders()] == [4]
+
+def test_recovery_restores_entry_cancel_and_amend_times(database, tmp_path):
+    directory = str(tmp_path / 'journal')
+    order_book.enable_journal(directory)
+    order_book.place_order('sell', 'X', 10, 1)
+    order_book.place_order('sell', 'X', 11, 1)
+    order_book.amend_order(2, price=12)
+    order_book.cancel_order(1)
+    query = "SELECT order_id, timestamp, entered_at, updated_at, status, price FROM orders"
+    conn = sqlite3.connect(database)
+    try:
+        written = conn.execute(query).fetchall()
+        conn.execute("DELETE FROM orders")
+        conn.commit()
+    finally:
+        conn.close()
+    order_book.set_database(database)
+    order_book.enable_journal(directory)
+    conn = sqlite3.connect(database)
+    try:
+        assert conn.execute(query).fetchall() == written
+    finally:
+        conn.close()
+    assert all(row[3] is not None for row in written)
+    assert written[1][2] < written[1][1]
@@ -0,0 +1,102 @@
+# tests/test_matching_engine.py
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from matching_engine import MatchingEngine, Order, SymbolBook
+
+def order(order_id, side, price, quantity, symbol='X'):
+    return Order(order_id, f"t{order_id:06d}", side, symbol, price, quantity)
+
+def test_sweep_fills_in_price_then_time_priority():
+    book = SymbolBook('X')
+    book.add(order(1, 'sell', 101, 5))
+    book.add(order(2, 'sell', 100, 5))
+    book.add(order(3, 'sell', 100, 5))
+    book.add(order(4, 'buy', 101, 12))
+    fills = book.match()
+    assert [(f.sell_order_id, f.price, f.quantity) for f in fills] == [(2, 100, 5), (3, 100, 5), (1, 101, 2)]
+    assert book.depth() == ([], [(101, 3)])
+
+def test_partial_fill_keeps_queue_position():
+    book = SymbolBook('X')
+    first, second = order(1, 'buy', 100, 10), order(2, 'buy', 100, 10)
+    book.add(first)
+    book.add(second)
+    book.add(order(3, 'sell', 100, 4))
+    fill, = book.match()
+    assert (fill.buy_order_id, fill.quantity, fill.buy_remaining, fill.sell_remaining) == (1, 4, 6, 0)
+    assert list(book.bids.best_level()) == [1, 2]
+    assert book.depth() == ([(100, 16)], [])
+
+def test_incoming_order_trades_at_resting_prices():
+    engine = MatchingEngine()
+    engine.add_order(order(1, 'buy', 95, 10))
+    engine.add_order(order(2, 'buy', 94, 10))
+    fills = engine.submit(order(3, 'sell', 90, 15), 'ioc')
+    assert [(f.buy_order_id, f.price, f.quantity) for f in fills] == [(1, 95, 10), (2, 94, 5)]
+
+def test_submit_rests_limit_remainder():
+    engine = MatchingEngine()
+    engine.add_order(order(1, 'sell', 100, 5))
+    incoming = order(2, 'buy', 101, 8)
+    fills = engine.submit(incoming)
+    assert [(f.price, f.quantity) for f in fills] == [(100, 5)]
+    assert engine.orders == {2: incoming}
+    assert engine.depth('X') == ([(101, 3)], [])
+
+def crossed_engine(symbols=8, orders=400):
+    engine = MatchingEngine()
+    order_id = 0
+    for i in range(orders):
+        for s in range(symbols):
+            order_id += 1
+            side = 'buy' if (i + s) % 2 else 'sell'
+            # Overlapping price ranges so every book ends up crossed
+            price = 1000 + (i * 7 + s * 3) % 40 - (0 if side == 'buy' else 15)
+            engine.add_order(order(order_id, side, price, 1 + (i * 5 + s) % 9, f"S{s}"))
+    return engine
+
+def test_parallel_sweep_matches_serial_sweep():
+    serial, parallel = crossed_engine(), crossed_engine()
+    expected = serial.match()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        fills = parallel.match(executor=executor, shards=3)
+    assert expected
+    # Timestamps are taken per fill, so only they may differ
+    assert [f._replace(timestamp=None) for f in fills] == [f._replace(timestamp=None) for f in expected]
+    for symbol in serial.books:
+        assert parallel.depth(symbol) == serial.depth(symbol)
+    assert parallel.orders.keys() == serial.orders.keys()
+    assert parallel.last_trade_id == serial.last_trade_id
+
+def test_amend_keeps_priority_only_for_size_reductions():
+    engine = MatchingEngine()
+    for order_id in (1, 2, 3):
+        engine.add_order(order(order_id, 'buy', 100, 10))
+    engine.amend(1, quantity=5)
+    engine.amend(2, price=101, timestamp='t9')
+    engine.amend(2, price=100)
+    assert list(engine.books['X'].bids.best_level()) == [1, 3, 2]
+    assert engine.depth('X') == ([(100, 25)], [])
+    with pytest.raises(ValueError):
+        engine.amend(1, quantity=6)
+
+@pytest.mark.parametrize('kind, price, quantity, filled, resting_asks', [
+    ('market', 0, 12, [(100, 5), (102, 5)], []),
+    ('ioc', 101, 12, [(100, 5)], [(102, 5)]),
+    ('fok', 102, 10, [(100, 5), (102, 5)], []),
+    ('fok', 102, 11, [], [(100, 5), (102, 5)]),
+    ('fok', 101, 10, [], [(100, 5), (102, 5)]),
+])
+def test_order_kinds_never_rest(kind, price, quantity, filled, resting_asks):
+    engine = MatchingEngine()
+    engine.add_order(order(1, 'sell', 100, 5))
+    engine.add_order(order(2, 'sell', 102, 5))
+    incoming = order(3, 'buy', price, quantity)
+    fills = engine.submit(incoming, kind)
+    assert [(f.price, f.quantity) for f in fills] == filled
+    assert incoming.remaining == quantity - sum(q for _, q in filled)
+    assert 3 not in engine.orders
+    assert engine.depth('X') == ([], resting_asks)
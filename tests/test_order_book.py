@@ -0,0 +1,56 @@
+# tests/test_order_book.py
+
+import math
+import threading
+
+import pytest
+
+import order_book
+from events import EventBus
+
+@pytest.mark.parametrize('price, quantity', [
+    (10, 0.00001),
+    (0.00001, 3),
+    (math.inf, 3),
+    (math.nan, 3),
+    (10, -1),
+    (1e300, 3),
+])
+def test_invalid_orders_are_rejected_before_taking_an_id(database, price, quantity):
+    with pytest.raises(ValueError):
+        order_book.place_order('buy', 'X', price, quantity)
+    assert order_book.get_engine().last_order_id == 0
+
+def test_level_changes_are_published_after_switching_databases(database):
+    subscription = order_book.subscribe(kinds=['level_change'])
+    try:
+        order_book.set_database(database)
+        order_book.place_order('sell', 'X', 10, 5)
+        event = subscription.get(timeout=5)
+    finally:
+        subscription.close()
+    assert event.data == {'symbol': 'X', 'side': 'sell', 'price': 10.0, 'quantity': 5.0}
+
+def test_closing_a_full_blocking_subscription_releases_the_publisher():
+    bus = EventBus()
+    subscription = bus.subscribe(maxsize=1, policy='block')
+    bus.publish('fill', 1)
+    publisher = threading.Thread(target=bus.publish, args=('fill', 2), daemon=True)
+    publisher.start()
+    publisher.join(0.3)
+    assert publisher.is_alive()
+    subscription.close()
+    publisher.join(5)
+    assert not publisher.is_alive()
+
+def test_invalid_amends_are_rejected(database):
+    order_id = order_book.place_order('buy', 'X', 10, 5)
+    for change in ({'price': 0.00001}, {'quantity': math.inf}, {'quantity': 6}):
+        with pytest.raises(ValueError):
+            order_book.amend_order(order_id, **change)
+    assert order_book.get_order_book('X') == ([(10.0, 5.0)], [])
+
+def test_market_orders_ignore_the_price(database):
+    order_book.place_order('buy', 'X', 10, 1)
+    _, fills = order_book.submit_order('sell', 'X', math.inf, 1, 'market')
+    assert [(f.price, f.quantity) for f in fills] == [(10.0, 1.0)]
@@ -0,0 +1,119 @@
+# tests/test_persistence.py
+
+import sqlite3
+
+import pytest
+
+import order_book
+from db_setup import migrate
+from matching_engine import from_lots, from_ticks
+from persistence import PersistenceError
+
+def stored_orders(path):
+    """Return {order_id: (status, price, quantity, filled_qty)} as written to the database."""
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0]: row[1:] for row in conn.execute(
+            "SELECT order_id, status, price, quantity, filled_qty FROM orders")}
+    finally:
+        conn.close()
+
+def assert_database_matches_engine(path):
+    order_book.flush()
+    engine = order_book.get_engine()
+    stored = stored_orders(path)
+    live = {order_id: row for order_id, row in stored.items() if row[0] in ('open', 'partial')}
+    assert live.keys() == engine.orders.keys()
+    for order_id, (status, price, quantity, filled_qty) in live.items():
+        order = engine.orders[order_id]
+        assert (price, quantity, filled_qty) == (from_ticks(order.price), from_lots(order.quantity),
+                                                 from_lots(order.filled_qty))
+        assert status == ('partial' if order.filled_qty else 'open')
+    return stored
+
+@pytest.mark.parametrize('durability', ['commit', 'group'])
+def test_database_follows_engine_through_fills_cancels_and_amends(database, durability):
+    order_book.configure_persistence(batch_size=3, durability=durability)
+    order_book.place_order('sell', 'X', 10, 5)
+    order_book.place_order('sell', 'X', 11, 5)
+    order_book.place_order('buy', 'X', 9, 4)
+    order_book.submit_order('buy', 'X', 10, 2)
+    assert order_book.amend_order(1, quantity=4) == []
+    order_book.amend_order(3, price=9.5, quantity=3)
+    order_book.cancel_order(1)
+    order_book.submit_order('buy', 'X', 12, 7, 'ioc')
+    order_book.place_order('sell', 'X', 9.5, 1)
+    order_book.match_orders()
+    stored = assert_database_matches_engine(database)
+    assert stored[1][0] == 'cancelled'
+    assert stored[2][0] == 'filled'
+    assert stored[5][0] == 'cancelled'
+    assert stored[6][0] == 'filled'
+    assert stored[3] == ('partial', 9.5, 3.0, 1.0)
+
+def test_reloaded_engine_matches_database(database):
+    order_book.place_order('sell', 'X', 10, 5)
+    order_book.submit_order('buy', 'X', 10, 2)
+    order_book.amend_order(1, price=10.5)
+    before = order_book.get_order_book('X')
+    order_book.set_database(database)
+    assert order_book.get_order_book('X') == before
+    assert_database_matches_engine(database)
+
+def test_failed_flush_discards_the_batch(database):
+    order_book.configure_persistence(durability='group', batch_size=100, flush_interval=60)
+    order_book.place_order('sell', 'X', 10, 5)
+    conn = sqlite3.connect(database)
+    # Take the next order id behind the writer's back
+    conn.execute("""INSERT INTO orders (order_id, timestamp, type, symbol, price, quantity, status)
+                    VALUES (2, 't', 'buy', 'Q', 1, 1, 'open')""")
+    conn.commit()
+    conn.close()
+    order_book.place_order('buy', 'X', 9, 1)
+    with pytest.raises(PersistenceError):
+        order_book.flush()
+    order_book.place_order('buy', 'Y', 9, 1)
+    order_book.flush()
+    assert sorted(stored_orders(database)) == [2, 3]
+
+def test_migrate_upgrades_a_database_without_order_kind_or_bars(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE orders (order_id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL,
+                    type TEXT NOT NULL, symbol TEXT NOT NULL, price REAL NOT NULL, quantity REAL NOT NULL,
+                    status TEXT NOT NULL, filled_qty REAL NOT NULL DEFAULT 0)""")
+    conn.execute("""CREATE TABLE trades (trade_id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL,
+                    buy_order_id INTEGER NOT NULL, sell_order_id INTEGER NOT NULL, symbol TEXT NOT NULL,
+                    price REAL NOT NULL, quantity REAL NOT NULL)""")
+    conn.execute("""INSERT INTO orders (timestamp, type, symbol, price, quantity, status)
+                    VALUES ('2025-01-01T00:00:00', 'sell', 'X', 10, 5, 'open')""")
+    conn.commit()
+    conn.close()
+    order_book.set_database(path)
+    try:
+        _, fills = order_book.submit_order('buy', 'X', 10, 3, 'ioc')
+        assert [(f.price, f.quantity) for f in fills] == [(10.0, 3.0)]
+        assert order_book.get_bars('X')[0][1:6] == (10.0, 10.0, 10.0, 10.0, 3.0)
+    finally:
+        order_book.set_database(':memory:')
+
+def test_open_orders_are_read_through_the_partial_index(database):
+    conn = sqlite3.connect(database)
+    conn.execute("CREATE INDEX idx_orders_book ON orders (status, symbol, type, price, timestamp)")
+    conn.commit()
+    conn.close()
+    for price in range(1, 50):
+        order_book.place_order('buy', 'X', price, 1)
+    order_book.place_order('sell', 'X', 1, 45)
+    order_book.flush()
+    conn = sqlite3.connect(database)
+    try:
+        migrate(conn)
+        conn.execute("ANALYZE")
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        plan = [row[3] for row in conn.execute("""EXPLAIN QUERY PLAN
+            SELECT order_id FROM orders WHERE status IN ('open', 'partial') ORDER BY timestamp ASC, order_id ASC""")]
+    finally:
+        conn.close()
+    assert 'idx_orders_book' not in indexes
+    assert plan == ['SCAN orders USING INDEX idx_orders_open_time']